@@ -0,0 +1,56 @@
+"""
+Shared helpers for the benchmark scripts.
+
+The scripts import the client modules from ``src/`` directly, so they can be
+run from the repository root without building the app, e.g.::
+
+    python benchmarks/connect_setup.py
+"""
+
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+if SRC_PATH not in sys.path:
+    sys.path.insert(0, SRC_PATH)
+
+# Keep downloads, spool files and caches of benchmark runs out of the
+# working directory.
+WORK_PATH = tempfile.mkdtemp(prefix="cfms_bench_")
+os.environ.setdefault("FLET_APP_STORAGE_TEMP", os.path.join(WORK_PATH, "temp"))
+os.environ.setdefault("FLET_APP_STORAGE_DATA", os.path.join(WORK_PATH, "data"))
+os.makedirs(os.environ["FLET_APP_STORAGE_TEMP"], exist_ok=True)
+os.makedirs(os.environ["FLET_APP_STORAGE_DATA"], exist_ok=True)
+
+
+def make_server_ssl_context() -> ssl.SSLContext:
+    """Create a server-side context with a throwaway self-signed certificate."""
+    with tempfile.TemporaryDirectory() as tmp:
+        certfile = os.path.join(tmp, "cert.pem")
+        keyfile = os.path.join(tmp, "key.pem")
+        subprocess.run(
+            [
+                "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+                "-keyout", keyfile, "-out", certfile,
+                "-days", "1", "-subj", "/CN=localhost",
+            ],
+            check=True,
+            capture_output=True,
+        )
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(certfile, keyfile)
+    return ssl_context
+
+
+def summarize(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return (
+        f"mean {statistics.fmean(samples) * 1000:8.2f} ms  "
+        f"p50 {statistics.median(samples) * 1000:8.2f} ms  "
+        f"p95 {p95 * 1000:8.2f} ms"
+    )
@@ -0,0 +1,99 @@
+"""
+Benchmark of the control message codecs on representative large listings.
+
+Only codecs that would be negotiated are measured: install the ``codecs``
+extra, with C extensions, to include MessagePack and CBOR.
+"""
+
+import argparse
+import time
+import uuid
+
+import _common
+
+from include.util.codec import get_available_codecs
+
+
+def make_list_directory(documents: int) -> dict:
+    return {
+        "code": 200,
+        "message": "OK",
+        "data": {
+            "parent_id": uuid.uuid4().hex,
+            "folders": [
+                {"id": uuid.uuid4().hex, "name": f"文件夹 {i}", "created_time": 1.7e9 + i}
+                for i in range(documents // 20)
+            ],
+            "documents": [
+                {
+                    "id": uuid.uuid4().hex,
+                    "title": f"Quarterly report {i}.docx",
+                    "size": 1024 * i,
+                    "last_modified": 1.7e9 + i,
+                }
+                for i in range(documents)
+            ],
+        },
+    }
+
+
+def make_view_audit_logs(entries: int) -> dict:
+    return {
+        "code": 200,
+        "message": "OK",
+        "data": {
+            "total": entries,
+            "entries": [
+                {
+                    "id": i,
+                    "action": "get_document",
+                    "username": f"user{i % 50}",
+                    "target": uuid.uuid4().hex,
+                    "data": {"document_id": uuid.uuid4().hex},
+                    "result": 200,
+                    "remote_address": "192.0.2.1",
+                    "logged_time": 1.7e9 + i,
+                }
+                for i in range(entries)
+            ],
+        },
+    }
+
+
+def bench(codec, payload: dict, rounds: int) -> tuple[float, float, int]:
+    encoded = codec.encode(payload)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        codec.encode(payload)
+    encode_time = (time.perf_counter() - started) / rounds
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        codec.decode(encoded)
+    decode_time = (time.perf_counter() - started) / rounds
+
+    size = len(encoded.encode() if isinstance(encoded, str) else encoded)
+    return encode_time, decode_time, size
+
+
+def main(size: int, rounds: int) -> None:
+    payloads = {
+        "list_directory": make_list_directory(size),
+        "view_audit_logs": make_view_audit_logs(size),
+    }
+    for name, payload in payloads.items():
+        print(f"{name} ({size} entries)")
+        for codec in get_available_codecs():
+            encode_time, decode_time, length = bench(codec, payload, rounds)
+            print(
+                f"  {codec.name:8} encode {encode_time * 1000:8.2f} ms  "
+                f"decode {decode_time * 1000:8.2f} ms  size {length / 1024:8.1f} KiB"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    main(args.size, args.rounds)
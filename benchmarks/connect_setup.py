@@ -0,0 +1,65 @@
+"""
+Micro-benchmark of transfer connection setup time.
+
+Starts a local TLS websocket server and compares opening connections with a
+freshly created SSLContext per connection (the previous behaviour) against
+``get_connection``, which caches the context and resumes TLS sessions.
+"""
+
+import argparse
+import asyncio
+import ssl
+import time
+
+import _common
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+
+from include.util.connect import get_connection
+
+
+async def _echo(websocket):
+    async for message in websocket:
+        await websocket.send(message)
+
+
+async def _connect_uncached(uri: str):
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    return await connect(uri, ssl=ssl_context, proxy=None)
+
+
+async def main(rounds: int) -> None:
+    async with serve(
+        _echo, "127.0.0.1", 0, ssl=_common.make_server_ssl_context()
+    ) as server:
+        port = server.sockets[0].getsockname()[1]
+        uri = f"wss://localhost:{port}"
+
+        uncached = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            conn = await _connect_uncached(uri)
+            uncached.append(time.perf_counter() - started)
+            await conn.close()
+
+        cached = []
+        reused = 0
+        for _ in range(rounds):
+            started = time.perf_counter()
+            conn = await get_connection(uri, disable_ssl_enforcement=True, proxy=None)
+            cached.append(time.perf_counter() - started)
+            if conn.transport.get_extra_info("ssl_object").session_reused:
+                reused += 1
+            await conn._wrapped_connection.close()
+
+    print(f"new context, full handshake  {_common.summarize(uncached)}")
+    print(f"cached context, resumption   {_common.summarize(cached)}")
+    print(f"sessions resumed: {reused}/{rounds}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=200)
+    asyncio.run(main(parser.parse_args().rounds))
@@ -0,0 +1,94 @@
+"""
+Checks and times the parallel AES-CFB decryption of download spools.
+
+A synthetic file is encrypted with a single ``AES.new(key, AES.MODE_CFB,
+iv=iv)`` pass, then decrypted with ``include.util.transfer.decrypt_spool``
+using different numbers of crypto workers. Every run must reproduce the
+original bytes exactly; the script exits with an error otherwise::
+
+    python benchmarks/decrypt.py --size 4294967296 --workers 1 2 4 8
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+
+import _common
+from Crypto.Cipher import AES
+
+from include.util.hashing import StreamHasher
+from include.util.transfer import decrypt_spool
+from include.util.workers import crypto_executor
+
+BLOCK_SIZE = 4 * 1024**2
+
+
+def make_spool(spool_path: str, size: int, key: bytes, iv: bytes) -> str:
+    """Writes ``size`` random bytes, encrypted, and returns their SHA-256."""
+    cipher = AES.new(key, AES.MODE_CFB, iv=iv)
+    plain_hash = hashlib.sha256()
+    written = 0
+    with open(spool_path, "wb") as f:
+        while written < size:
+            block = os.urandom(min(BLOCK_SIZE, size - written))
+            plain_hash.update(block)
+            f.write(cipher.encrypt(block))
+            written += len(block)
+    return plain_hash.hexdigest()
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def bench_decrypt(
+    spool_path: str, out_path: str, key: bytes, iv: bytes, workers: int
+) -> tuple[float, str, str]:
+    crypto_executor.resize(workers)
+    hasher = StreamHasher()
+    started = time.perf_counter()
+    async for _ in decrypt_spool(spool_path, out_path, key, iv, hasher):
+        pass
+    elapsed = time.perf_counter() - started
+    return elapsed, hasher.hexdigest(), file_sha256(out_path)
+
+
+async def main(args: argparse.Namespace) -> int:
+    spool_path = os.path.join(_common.WORK_PATH, "spool.part")
+    out_path = os.path.join(_common.WORK_PATH, "plain.bin")
+    key, iv = os.urandom(32), os.urandom(16)
+
+    print(f"encrypting {args.size / 1024**2:.1f} MB of synthetic data")
+    expected = make_spool(spool_path, args.size, key, iv)
+
+    failures = 0
+    for workers in args.workers:
+        elapsed, streamed, written = await bench_decrypt(
+            spool_path, out_path, key, iv, workers
+        )
+        identical = streamed == written == expected
+        failures += not identical
+        print(
+            f"workers {workers:3d}  {args.size / elapsed / 1024**2:10.2f} MB/s"
+            f"  {'identical' if identical else 'MISMATCH'}"
+        )
+
+    crypto_executor.shutdown()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    # Deliberately not a multiple of the AES block or decrypt segment size
+    parser.add_argument("--size", type=int, default=256 * 1024**2 + 4093)
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1, 2, os.cpu_count() or 1]
+    )
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,156 @@
+"""
+Headless protocol benchmarks against the local stand-in server.
+
+Drives ``include.util.requests`` and ``include.util.transfer`` exactly as the
+app does and reports control requests per second and transfer MB/s::
+
+    python benchmarks/protocol.py --latency 0.02 --document-size 33554432
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import _common
+from server import StandInConfig, StandInServer
+
+from include.util.connect import ConnectionPool, get_connection
+from include.util.requests import do_batch_request, do_request
+from include.util.supervisor import negotiate_connection
+from include.util.transfer import (
+    receive_file_from_server,
+    receive_file_segmented,
+    upload_file_to_server,
+)
+
+
+async def bench_sequential_requests(conn, count: int) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        await do_request(conn, "list_directory", {"folder_id": None})
+    return count / (time.perf_counter() - started)
+
+
+async def bench_concurrent_requests(conn, count: int) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(do_request(conn, "list_directory", {"folder_id": None}) for _ in range(count))
+    )
+    return count / (time.perf_counter() - started)
+
+
+async def bench_batch_requests(conn, count: int) -> float:
+    started = time.perf_counter()
+    await do_batch_request(
+        conn, [{"action": "create_document", "data": {}} for _ in range(count)]
+    )
+    return count / (time.perf_counter() - started)
+
+
+async def bench_upload(uri: str, conn, file_path: str) -> float:
+    response = await do_request(conn, "create_document", {"title": "bench"})
+    transfer_conn = await get_connection(uri, disable_ssl_enforcement=True, proxy=None)
+    try:
+        started = time.perf_counter()
+        async for _ in upload_file_to_server(
+            transfer_conn, response["data"]["task_data"]["task_id"], file_path
+        ):
+            pass
+        elapsed = time.perf_counter() - started
+    finally:
+        await transfer_conn._wrapped_connection.close()
+    return os.path.getsize(file_path) / elapsed / 1024**2
+
+
+async def bench_download(uri: str, conn, file_path: str) -> float:
+    response = await do_request(conn, "get_document", {"document_id": "document-0"})
+    transfer_conn = await get_connection(
+        uri, disable_ssl_enforcement=True, max_size=1024**2 * 4, proxy=None
+    )
+    try:
+        started = time.perf_counter()
+        async for _ in receive_file_from_server(
+            transfer_conn, response["data"]["task_data"]["task_id"], file_path
+        ):
+            pass
+        elapsed = time.perf_counter() - started
+    finally:
+        await transfer_conn._wrapped_connection.close()
+    return os.path.getsize(file_path) / elapsed / 1024**2
+
+
+async def bench_segmented_download(
+    uri: str, conn, file_path: str, connections: int
+) -> float:
+    response = await do_request(conn, "get_document", {"document_id": "document-0"})
+    pool = ConnectionPool(max_connections_per_server=connections)
+    try:
+        started = time.perf_counter()
+        async for _ in receive_file_segmented(
+            pool,
+            uri,
+            response["data"]["task_data"]["task_id"],
+            file_path,
+            max_connections=connections,
+            disable_ssl_enforcement=True,
+            max_size=1024**2 * 4,
+            proxy=None,
+        ):
+            pass
+        elapsed = time.perf_counter() - started
+    finally:
+        await pool.close_all()
+    return os.path.getsize(file_path) / elapsed / 1024**2
+
+
+async def main(args: argparse.Namespace) -> None:
+    server = StandInServer(
+        StandInConfig(
+            latency=args.latency,
+            bandwidth=args.bandwidth,
+            document_size=args.document_size,
+            chunk_size=args.chunk_size,
+            binary_chunks=not args.json_chunks,
+        )
+    )
+    upload_path = os.path.join(_common.WORK_PATH, "upload.bin")
+    download_path = os.path.join(_common.WORK_PATH, "download.bin")
+    with open(upload_path, "wb") as f:
+        f.write(os.urandom(args.document_size))
+
+    async with server.serve() as ws_server:
+        port = ws_server.sockets[0].getsockname()[1]
+        uri = f"wss://localhost:{port}"
+
+        conn = await get_connection(uri, disable_ssl_enforcement=True, proxy=None)
+        await negotiate_connection(conn)
+        print(f"codec: {conn.dispatcher.codec.name}, latency: {args.latency * 1000:.0f} ms")
+
+        print(f"sequential requests  {await bench_sequential_requests(conn, args.requests):10.1f} req/s")
+        print(f"concurrent requests  {await bench_concurrent_requests(conn, args.requests):10.1f} req/s")
+        print(f"batched requests     {await bench_batch_requests(conn, args.requests):10.1f} req/s")
+
+        for _ in range(args.rounds):
+            print(f"upload               {await bench_upload(uri, conn, upload_path):10.2f} MB/s")
+        for _ in range(args.rounds):
+            print(f"download             {await bench_download(uri, conn, download_path):10.2f} MB/s")
+        for _ in range(args.rounds):
+            speed = await bench_segmented_download(uri, conn, download_path, args.connections)
+            print(f"segmented download   {speed:10.2f} MB/s")
+
+        await conn.dispatcher.close()
+        await conn._wrapped_connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=int, default=0)
+    parser.add_argument("--document-size", type=int, default=8 * 1024**2)
+    parser.add_argument("--chunk-size", type=int, default=8192)
+    parser.add_argument("--json-chunks", action="store_true")
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
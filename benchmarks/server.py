@@ -0,0 +1,466 @@
+"""
+A local stand-in for a CFMS server, for deterministic client benchmarks.
+
+It implements the subset of the protocol that the client uses: ``server_info``,
+``login``, ``get_user_info``, ``list_directory``, ``create_document``,
+``get_document``, ``get_document_info``, ``view_audit_logs``, ``list_users``, ``batch`` and the
+``upload_file``/``download_file`` transfer conversations, including the
+AES-CFB chunk protocol, resumable chunk ranges for downloads, and resumable
+and deduplicated uploads. Response latency, transfer bandwidth, payload sizes, dropped transfer
+connections and corrupt download chunks are configurable. All data is synthetic and kept in memory.
+
+Run it on its own with::
+
+    python benchmarks/server.py --port 5104 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+
+import _common
+from Crypto.Cipher import AES
+from websockets.asyncio.server import serve
+from websockets.protocol import State
+
+from include.constants import PROTOCOL_VERSION
+from include.util.codec import Codec, JSONCodec, get_available_codecs
+from include.util.framing import encode_chunk_frame
+
+
+@dataclass
+class StandInConfig:
+    # Delay before every control response, in seconds
+    latency: float = 0.0
+    # Transfer bandwidth per direction in bytes per second, 0 for unlimited
+    bandwidth: int = 0
+    # Number of documents returned by list_directory
+    directory_size: int = 200
+    # Number of entries returned by list_users and view_audit_logs
+    listing_size: int = 200
+    # Size of the document served by get_document
+    document_size: int = 8 * 1024**2
+    # Size of the chunks of a download
+    chunk_size: int = 8192
+    # Whether download chunks may be sent as binary frames
+    binary_chunks: bool = True
+    # Whether download_file honours the chunk ranges a resuming client asks for
+    download_ranges: bool = True
+    # Drop the connection after sending this many download chunks, 0 to never
+    drop_after_chunks: int = 0
+    # Drop the connection after receiving this many bytes of an upload, 0 to
+    # never
+    drop_upload_after: int = 0
+    # Corrupt every this many download chunks the first time they are sent,
+    # 0 to never
+    corrupt_every: int = 0
+    # Whether responses carry the request_id of their request
+    echo_request_id: bool = True
+    # Server features announced in server_info
+    features: list[str] = field(
+        default_factory=lambda: [
+            "batch",
+            "ranged_download",
+            "resumable_upload",
+            "deduplicated_upload",
+        ]
+    )
+
+
+class StandInServer(object):
+    def __init__(self, config: StandInConfig | None = None) -> None:
+        self.config = config or StandInConfig()
+        self.codecs: dict[str, Codec] = {
+            codec.name: codec for codec in get_available_codecs()
+        }
+        self.uploads: dict[str, bytes] = {}
+        # The declared hash and bytes received so far of unfinished uploads
+        self._partial_uploads: dict[str, tuple[str, bytearray]] = {}
+        # Uploaded contents by SHA-256, for deduplicated uploads
+        self._contents: dict[str, bytes] = {}
+        self._tasks: dict[str, dict] = {}
+        self._document = os.urandom(self.config.document_size)
+        self._document_sha256 = hashlib.sha256(self._document).hexdigest()
+
+    # Control actions
+
+    def _response(self, data: dict | None = None, code: int = 200) -> dict:
+        return {"code": code, "message": "OK" if code == 200 else "Error", "data": data or {}}
+
+    def _new_task(self, **task) -> dict:
+        task_id = uuid.uuid4().hex
+        self._tasks[task_id] = task
+        now = time.time()
+        return {"task_id": task_id, "start_time": now, "end_time": now + 3600}
+
+    def action_server_info(self, data: dict) -> dict:
+        return self._response(
+            {
+                "server_name": "CFMS stand-in",
+                "version": "stand-in",
+                "protocol_version": PROTOCOL_VERSION,
+                "encodings": list(self.codecs),
+                "features": self.config.features,
+            }
+        )
+
+    def action_login(self, data: dict) -> dict:
+        return self._response(
+            {
+                "token": uuid.uuid4().hex,
+                "exp": time.time() + 3600,
+                "nickname": data.get("username"),
+                "permissions": ["super_list_directory", "view_audit_logs"],
+                "groups": ["user"],
+            }
+        )
+
+    def action_get_user_info(self, data: dict) -> dict:
+        return self._response(self._make_user(0) | {"username": data.get("username")})
+
+    def action_list_directory(self, data: dict) -> dict:
+        return self._response(
+            {
+                "parent_id": None,
+                "folders": [
+                    {"id": f"folder-{i}", "name": f"Folder {i}", "created_time": 1.7e9 + i}
+                    for i in range(self.config.directory_size // 10)
+                ],
+                "documents": [
+                    {
+                        "id": f"document-{i}",
+                        "title": f"Document {i}.pdf",
+                        "size": self.config.document_size,
+                        "last_modified": 1.7e9 + i,
+                    }
+                    for i in range(self.config.directory_size)
+                ],
+            }
+        )
+
+    def _held_content(self, sha256: str | None, size: int | None) -> bytes | None:
+        if "deduplicated_upload" not in self.config.features:
+            return None
+        content = self._contents.get(sha256 or "")
+        return content if content is not None and len(content) == size else None
+
+    def action_create_document(self, data: dict) -> dict:
+        # A document of content the server holds needs no upload task
+        if (content := self._held_content(data.get("sha256"), data.get("size"))) is not None:
+            document_id = uuid.uuid4().hex
+            self.uploads[document_id] = content
+            return self._response({"document_id": document_id, "deduplicated": True})
+        return self._response(
+            {"task_data": self._new_task(mode="upload", title=data.get("title"))}
+        )
+
+    def action_get_document(self, data: dict) -> dict:
+        # The key and IV belong to the task, so a download can be resumed.
+        return self._response(
+            {
+                "task_data": self._new_task(
+                    mode="download", key=os.urandom(32), iv=os.urandom(16)
+                )
+            }
+        )
+
+    def action_get_document_info(self, data: dict) -> dict:
+        document_id = data.get("document_id")
+        return self._response(
+            {
+                "document_id": document_id,
+                "title": f"{document_id}.pdf",
+                "size": self.config.document_size,
+                "created_time": 1.7e9,
+                "last_modified": 1.7e9,
+                "parent_id": None,
+                "access_rules": {},
+                "info_code": 0,
+            }
+        )
+
+    def _make_user(self, i: int) -> dict:
+        return {
+            "username": f"user{i}",
+            "nickname": f"User {i}",
+            "permissions": [],
+            "groups": ["user"],
+            "created_time": 1.7e9,
+            "last_login": 1.7e9 + i,
+        }
+
+    def action_list_users(self, data: dict) -> dict:
+        return self._response(
+            {"users": [self._make_user(i) for i in range(self.config.listing_size)]}
+        )
+
+    def action_view_audit_logs(self, data: dict) -> dict:
+        offset = data.get("offset", 0)
+        count = min(data.get("count", 50), self.config.listing_size)
+        return self._response(
+            {
+                "total": self.config.listing_size,
+                "entries": [
+                    {
+                        "id": offset + i,
+                        "action": "get_document",
+                        "username": f"user{i % 10}",
+                        "target": f"document-{i}",
+                        "data": {},
+                        "result": 200,
+                        "remote_address": "127.0.0.1",
+                        "logged_time": 1.7e9 + i,
+                    }
+                    for i in range(count)
+                ],
+            }
+        )
+
+    def action_batch(self, data: dict) -> dict:
+        return self._response(
+            {"results": [self.handle_action(item) for item in data.get("requests", [])]}
+        )
+
+    def handle_action(self, request: dict) -> dict:
+        handler = getattr(self, f"action_{request.get('action')}", None)
+        if handler is None:
+            return self._response(code=404)
+        return handler(request.get("data") or {})
+
+    async def _respond(self, websocket, request: dict, codec: Codec) -> None:
+        if self.config.latency:
+            await asyncio.sleep(self.config.latency)
+
+        response = self.handle_action(request)
+        if self.config.echo_request_id and "request_id" in request:
+            response["request_id"] = request["request_id"]
+        await websocket.send(codec.encode(response))
+
+    # Transfers
+
+    async def _throttle(self, size: int) -> None:
+        if self.config.bandwidth:
+            await asyncio.sleep(size / self.config.bandwidth)
+
+    async def _handle_upload(self, websocket, data: dict) -> None:
+        task_id = data["task_id"]
+        resume = "resumable_upload" in self.config.features and data.get("resume")
+        partial = self._partial_uploads.get(task_id)
+
+        if task_id in self._tasks and (
+            content := self._held_content(data.get("sha256"), data.get("file_size"))
+        ) is not None:
+            # Complete the task with the content the server already holds
+            self._tasks.pop(task_id)
+            self.uploads[task_id] = content
+            await websocket.send(
+                json.dumps({"action": "transfer_file", "data": {"exists": True}})
+            )
+            return
+
+        metadata = {}
+        if resume:
+            # Report what has been committed, so the client can continue
+            metadata = {
+                "offset": len(partial[1]) if partial else 0,
+                "sha256": partial[0] if partial else None,
+            }
+        await websocket.send(json.dumps({"action": "transfer_file", "data": metadata}))
+        task_info = json.loads(await websocket.recv())
+        file_size = task_info["data"]["file_size"]
+        sha256 = task_info["data"]["sha256"]
+        offset = task_info["data"].get("offset", 0) if resume else 0
+
+        if task_id not in self._tasks or (
+            offset and (partial is None or partial[0] != sha256 or offset > len(partial[1]))
+        ):
+            await websocket.send("stop")
+            return
+        received = partial[1][:offset] if offset else bytearray()
+        if resume:
+            self._partial_uploads[task_id] = (sha256, received)
+        await websocket.send("ready")
+
+        received_now = 0
+        while True:
+            chunk = await websocket.recv()
+            received += chunk
+            received_now += len(chunk)
+            await self._throttle(len(chunk))
+            if len(received) >= file_size:
+                break
+            if received_now >= self.config.drop_upload_after > 0:
+                await websocket.close()
+                return
+        self._tasks.pop(task_id, None)
+        self._partial_uploads.pop(task_id, None)
+        self.uploads[task_id] = bytes(received)
+        self._contents[hashlib.sha256(received).hexdigest()] = self.uploads[task_id]
+        if resume:
+            await websocket.send(
+                json.dumps({"action": "transfer_file", "data": {"offset": len(received)}})
+            )
+
+    async def _handle_download(self, websocket, data: dict) -> None:
+        task_id = data["task_id"]
+        binary = self.config.binary_chunks and "binary" in data.get(
+            "chunk_encodings", []
+        )
+        chunk_size = self.config.chunk_size
+        task = self._tasks.get(task_id)
+        document = self._document if task else b""
+        total_chunks = -(-len(document) // chunk_size)
+
+        ranges = data.get("ranges") if self.config.download_ranges else None
+        if ranges is not None:
+            indexes = [i for start, end in ranges for i in range(start, end)]
+        else:
+            indexes = list(range(total_chunks))
+
+        metadata = {
+            "sha256": self._document_sha256 if document else None,
+            "file_size": len(document),
+            "chunk_size": chunk_size,
+            "total_chunks": total_chunks,
+            "chunk_encoding": "binary" if binary else "json",
+        }
+        if ranges is not None:
+            metadata["ranges"] = ranges
+        await websocket.send(json.dumps({"action": "transfer_file", "data": metadata}))
+        if await websocket.recv() != "ready" or not document:
+            return
+
+        key, iv = task["key"], task["iv"]
+        if "encrypted" not in task:
+            task["encrypted"] = AES.new(key, AES.MODE_CFB, iv=iv).encrypt(document)
+        encrypted = task["encrypted"]
+
+        for sent, index in enumerate(indexes):
+            if sent == self.config.drop_after_chunks > 0:
+                await websocket.close()
+                return
+
+            chunk = encrypted[index * chunk_size : (index + 1) * chunk_size]
+            chunk_hash = hashlib.sha256(chunk).hexdigest()
+            corrupted = task.setdefault("corrupted", set())
+            if (
+                self.config.corrupt_every
+                and index % self.config.corrupt_every == 0
+                and index not in corrupted
+            ):
+                corrupted.add(index)
+                chunk = bytes([chunk[0] ^ 0xFF]) + chunk[1:]
+            if binary:
+                await websocket.send(
+                    encode_chunk_frame(
+                        index,
+                        chunk,
+                        chunk_hash,
+                        iv if index == 0 else None,
+                    )
+                )
+                await self._throttle(len(chunk))
+                continue
+
+            chunk_data = {
+                "index": index,
+                "hash": chunk_hash,
+                "chunk": base64.b64encode(chunk).decode(),
+            }
+            if index == 0:
+                chunk_data["iv"] = base64.b64encode(iv).decode()
+            await websocket.send(
+                json.dumps({"action": "transfer_chunk", "data": chunk_data})
+            )
+            await self._throttle(len(chunk))
+
+        await websocket.send(
+            json.dumps(
+                {"action": "transfer_key", "data": {"key": base64.b64encode(key).decode()}}
+            )
+        )
+        if ranges is None:
+            # Ranged tasks stay open, as more segments may be requested
+            self._tasks.pop(task_id, None)
+
+    # Connection handling
+
+    async def handler(self, websocket) -> None:
+        json_codec = JSONCodec()
+        pending: set[asyncio.Task] = set()
+
+        async for raw in websocket:
+            if websocket.state is not State.OPEN:
+                # Dropped on purpose, ignore what the client still sent
+                break
+            if isinstance(raw, bytes):
+                if not raw:
+                    # Trailing empty chunk of an upload whose size is a
+                    # multiple of the chunk size.
+                    continue
+                codec = self.codecs.get("msgpack") or self.codecs.get("cbor")
+                if codec is None:
+                    continue
+            else:
+                codec = json_codec
+            request = codec.decode(raw)
+
+            match request.get("action"):
+                case "upload_file":
+                    await self._handle_upload(websocket, request["data"])
+                case "download_file":
+                    await self._handle_download(websocket, request["data"])
+                case _:
+                    # Control requests are answered concurrently, so a client
+                    # can pipeline them.
+                    task = asyncio.create_task(self._respond(websocket, request, codec))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+
+    def serve(self, host: str = "127.0.0.1", port: int = 0, tls: bool = True):
+        """Returns the websockets server context manager."""
+        return serve(
+            self.handler,
+            host,
+            port,
+            ssl=_common.make_server_ssl_context() if tls else None,
+            max_size=None,
+        )
+
+
+async def main(args: argparse.Namespace) -> None:
+    server = StandInServer(
+        StandInConfig(
+            latency=args.latency,
+            bandwidth=args.bandwidth,
+            document_size=args.document_size,
+            chunk_size=args.chunk_size,
+            binary_chunks=not args.json_chunks,
+        )
+    )
+    async with server.serve(args.host, args.port, tls=not args.no_tls):
+        scheme = "ws" if args.no_tls else "wss"
+        print(f"Serving on {scheme}://{args.host}:{args.port}")
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5104)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=int, default=0)
+    parser.add_argument("--document-size", type=int, default=8 * 1024**2)
+    parser.add_argument("--chunk-size", type=int, default=8192)
+    parser.add_argument("--json-chunks", action="store_true")
+    parser.add_argument("--no-tls", action="store_true")
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,87 @@
+"""
+Upload throughput against the local stand-in server, by chunk size.
+
+Uploads a synthetic file with each fixed ``--chunk-sizes`` value and then
+with the adaptive chunk size of ``include.util.transfer.upload_file_to_server``,
+reporting MB/s and the number of websocket frames sent::
+
+    python benchmarks/upload.py --size 268435456 --latency 0.02
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from typing import Optional
+
+import _common
+from server import StandInConfig, StandInServer
+
+from include.util.connect import get_connection
+from include.util.requests import do_request
+from include.util.transfer import upload_file_to_server
+
+
+async def bench_upload(
+    uri: str, conn, file_path: str, max_size: int, chunk_size: Optional[int]
+) -> tuple[float, int]:
+    response = await do_request(conn, "create_document", {"title": "bench"})
+    transfer_conn = await get_connection(
+        uri, disable_ssl_enforcement=True, max_size=max_size, proxy=None
+    )
+    frames = 0
+    try:
+        started = time.perf_counter()
+        async for _ in upload_file_to_server(
+            transfer_conn,
+            response["data"]["task_data"]["task_id"],
+            file_path,
+            chunk_size=chunk_size,
+        ):
+            frames += 1
+        elapsed = time.perf_counter() - started
+    finally:
+        await transfer_conn._wrapped_connection.close()
+    return os.path.getsize(file_path) / elapsed / 1024**2, frames
+
+
+async def main(args: argparse.Namespace) -> None:
+    server = StandInServer(
+        StandInConfig(latency=args.latency, bandwidth=args.bandwidth)
+    )
+    upload_path = os.path.join(_common.WORK_PATH, "upload.bin")
+    with open(upload_path, "wb") as f:
+        f.write(os.urandom(args.size))
+
+    async with server.serve() as ws_server:
+        port = ws_server.sockets[0].getsockname()[1]
+        uri = f"wss://localhost:{port}"
+        conn = await get_connection(uri, disable_ssl_enforcement=True, proxy=None)
+
+        print(f"{args.size / 1024**2:.1f} MB, max_size {args.max_size // 1024} KB")
+        for chunk_size in [*args.chunk_sizes, None]:
+            label = f"{chunk_size // 1024} KB" if chunk_size else "adaptive"
+            for _ in range(args.rounds):
+                speed, frames = await bench_upload(
+                    uri, conn, upload_path, args.max_size, chunk_size
+                )
+                print(f"{label:>10}  {speed:10.2f} MB/s  {frames:8d} frames")
+
+        await conn.dispatcher.close()
+        await conn._wrapped_connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=64 * 1024**2)
+    parser.add_argument("--max-size", type=int, default=4 * 1024**2)
+    parser.add_argument(
+        "--chunk-sizes",
+        type=int,
+        nargs="+",
+        default=[8192, 65536, 262144, 1024**2, 4 * 1024**2],
+    )
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=int, default=0)
+    parser.add_argument("--rounds", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
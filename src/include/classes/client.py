@@ -1,22 +1,52 @@
 import asyncio
 from websockets import ClientProtocol
 from websockets.asyncio.client import ClientConnection
+from include.classes.dispatcher import RequestDispatcher
+
+
+def _wrapped_state(name: str) -> property:
+    """
+    Forwards the attribute ``name`` to the wrapped connection.
+
+    The wrapped connection is the transport's protocol, so it is the one told
+    about incoming frames, flow control and the connection being lost, and it
+    keeps that state. ``ClientConnection.__init__`` assigns fresh defaults to
+    these attributes; those assignments are ignored, otherwise the wrapper
+    would keep its own copy and e.g. ``recv()`` would wait forever after the
+    peer goes away.
+    """
+
+    def getter(self: "LockableClientConnection"):
+        return getattr(self._wrapped_connection, name)
+
+    def setter(self: "LockableClientConnection", value) -> None:
+        pass
+
+    return property(getter, setter)
 
 
 class LockableClientConnection(ClientConnection):
+    transport = _wrapped_state("transport")
+    recv_messages = _wrapped_state("recv_messages")
+    recv_exc = _wrapped_state("recv_exc")
+    connection_lost_waiter = _wrapped_state("connection_lost_waiter")
+    paused = _wrapped_state("paused")
+    drain_waiters = _wrapped_state("drain_waiters")
+
     def __init__(
         self,
         connection: ClientConnection,
     ) -> None:
         self.lock = asyncio.Lock()
         self._wrapped_connection = connection
+        self.dispatcher = RequestDispatcher(self)
+        # The queue and write limits only apply to the wrapped connection,
+        # which set them up when it was connected.
         super().__init__(
             connection.protocol,
             ping_interval=connection.ping_interval,
             ping_timeout=connection.ping_timeout,
             close_timeout=connection.close_timeout,
-            max_queue=connection.max_queue,
-            write_limit=connection.write_limit,
         )
 
     def __getattr__(self, name):
@@ -5,6 +5,7 @@ from flet_permission_handler import PermissionHandler
 
 from include.classes.client import LockableClientConnection
 from include.constants import FLET_APP_STORAGE_DATA
+from include.util.workers import DEFAULT_CRYPTO_WORKERS
 
 PREFERENCES_PATH = f'{FLET_APP_STORAGE_DATA}/preferences.yaml'
 
@@ -69,6 +70,12 @@ class AppConfig(object):
                 "proxy_settings": None,
                 "custom_proxy": "",
                 "enable_conn_history_logging": False,
+                "download_connections": 4,
+                "crypto_workers": DEFAULT_CRYPTO_WORKERS,
+                "upload_limit": 0,  # KB/s, 0 for unlimited
+                "download_limit": 0,
+                "document_cache_size": 512,  # MB
+                "upload_workers": None,  # Depends on the platform
             }
         }
 
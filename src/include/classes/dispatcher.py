@@ -0,0 +1,330 @@
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+from uuid import uuid4
+from websockets.exceptions import ConnectionClosed
+from include.classes.exceptions.request import ConnectionLostError, RequestTimeoutError
+from include.util.codec import Codec, JSONCodec
+from include.util.metrics import metrics
+from include.util.shaping import bandwidth
+
+if TYPE_CHECKING:
+    from include.classes.client import LockableClientConnection
+
+__all__ = ["RequestDispatcher", "IDEMPOTENT_ACTIONS"]
+
+_json_codec = JSONCodec()
+
+# Read-only actions that can safely be sent again after a reconnect.
+IDEMPOTENT_ACTIONS = frozenset(
+    {
+        "server_info",
+        "list_directory",
+        "get_directory_info",
+        "get_document_info",
+        "list_users",
+        "get_user_info",
+        "list_groups",
+        "get_group_info",
+        "view_audit_logs",
+    }
+)
+
+
+class RequestDispatcher(object):
+    """
+    Multiplexes control requests over a single websocket connection.
+
+    Every outgoing request is tagged with a ``request_id`` and registered as a
+    pending future. A background reader task receives responses and resolves
+    the matching future, so any number of requests can be in flight at once
+    instead of holding the connection lock for a full send/recv cycle.
+
+    Responses can only be matched by their ``request_id`` once the server has
+    shown that it echoes it. Until then requests are sent one at a time, and a
+    response without an ID resolves the one request in flight.
+
+    Messages are serialized with ``codec``, which starts out as JSON and may be
+    replaced once a binary encoding has been negotiated with the server.
+    ``supports_batch`` is set when the server announces the ``batch`` feature,
+    ``supports_ranged_download`` when it announces ``ranged_download``,
+    ``supports_resumable_upload`` when it announces ``resumable_upload`` and
+    ``supports_deduplicated_upload`` when it announces ``deduplicated_upload``.
+
+    If ``reconnect_handler`` is set, losing the connection does not fail every
+    request. The handler is called to open a replacement connection, requests
+    for ``IDEMPOTENT_ACTIONS`` that were in flight are sent again over it and
+    new requests wait until it is ready. Other in-flight requests fail with
+    ``ConnectionLostError``, as the server may already have carried them out.
+    If the handler gives up, every pending request fails the same way and
+    ``reconnect_failed_handler`` is called with the handler's exception.
+
+    A request that runs past its deadline raises ``RequestTimeoutError`` and a
+    late response to it is discarded. When the server does not echo
+    ``request_id`` the late response could not be told apart from the answer to
+    the next request, so the connection is dropped and handled as if it had
+    been lost.
+    """
+
+    def __init__(self, conn: "LockableClientConnection") -> None:
+        self.conn = conn
+        self.codec: Codec = _json_codec
+        self.supports_batch = False
+        self.supports_ranged_download = False
+        self.supports_resumable_upload = False
+        self.supports_deduplicated_upload = False
+        self.echoes_request_id: Optional[bool] = None
+        self.reconnect_handler: Optional[
+            Callable[[], Awaitable["LockableClientConnection"]]
+        ] = None
+        self.reconnect_failed_handler: Optional[Callable[[BaseException], None]] = (
+            None
+        )
+        self._pending: dict[str, asyncio.Future[dict[str, Any]]] = {}
+        self._messages: dict[str, dict[str, Any]] = {}
+        self._sent: set[str] = set()
+        self._replay: set[str] = set()
+        self._reader_task: Optional[asyncio.Task] = None
+        # Held by the request in flight while responses are matched by order
+        self._in_turn = asyncio.Lock()
+        self._reconnect_task: Optional[asyncio.Task] = None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    @property
+    def reconnecting(self) -> bool:
+        return self._reconnect_task is not None and not self._reconnect_task.done()
+
+    def _ensure_reader(self) -> None:
+        if self._reader_task is None or self._reader_task.done():
+            self._reader_task = asyncio.create_task(self._read_loop(self.conn))
+
+    async def _read_loop(self, conn: "LockableClientConnection") -> None:
+        try:
+            while True:
+                raw = await conn.recv()
+                # A connection given up on may still hand out buffered frames.
+                if self._reader_task is not asyncio.current_task():
+                    return
+                self._dispatch(raw)
+        except asyncio.CancelledError:
+            self._fail_all(ConnectionError("Request dispatcher stopped"))
+            raise
+        except Exception as exc:
+            if self.reconnect_handler is None:
+                self._fail_all(exc)
+            else:
+                self._connection_lost(conn, exc)
+
+    def _dispatch(self, raw: str | bytes) -> None:
+        decode_started = time.perf_counter()
+        if isinstance(raw, str):
+            response: dict[str, Any] = _json_codec.decode(raw)
+        else:
+            response = self.codec.decode(raw)
+        decode_time = time.perf_counter() - decode_started
+        size = len(raw.encode()) if isinstance(raw, str) else len(raw)
+        # Requests are interactive: they count against the rate limits but
+        # never wait for them, transfers make up for the bytes instead.
+        bandwidth.download.charge(size)
+
+        if (request_id := response.get("request_id")) is not None:
+            self.echoes_request_id = True
+            future = self._pending.pop(request_id, None)
+        elif (
+            request_id := next((i for i in self._pending if i in self._sent), None)
+        ) is not None:
+            future = self._pending.pop(request_id)
+        else:
+            future = None
+
+        metrics.record_decode(
+            self._messages.get(request_id, {}).get("action", "unknown"),
+            decode_time,
+            size,
+        )
+
+        # Late responses to requests that are no longer waiting are dropped.
+        if future is not None and not future.done():
+            future.set_result(response)
+
+    def _fail(self, request_id: str, exc: BaseException) -> None:
+        self._messages.pop(request_id, None)
+        future = self._pending.pop(request_id, None)
+        if future is not None and not future.done():
+            future.set_exception(exc)
+
+    def _fail_all(self, exc: BaseException) -> None:
+        for request_id in list(self._pending):
+            self._fail(request_id, exc)
+        self._sent.clear()
+        self._replay.clear()
+
+    def _fail_lost(self, request_id: str, exc: BaseException) -> None:
+        lost = ConnectionLostError(self._messages[request_id]["action"])
+        lost.__cause__ = exc
+        self._fail(request_id, lost)
+
+    def _connection_lost(
+        self, conn: "LockableClientConnection", exc: BaseException
+    ) -> None:
+        # Ignore failures of a connection that has already been replaced.
+        if conn is not self.conn:
+            return
+
+        in_flight, self._sent = self._sent, set()
+        for request_id in in_flight:
+            if request_id not in self._pending:
+                continue
+            if self._messages[request_id]["action"] in IDEMPOTENT_ACTIONS:
+                self._replay.add(request_id)
+            else:
+                self._fail_lost(request_id, exc)
+
+        if not self.reconnecting:
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    def _desynchronised(self, request_id: str) -> None:
+        conn = self.conn
+        exc = ConnectionError(
+            f'No response to "{self._messages[request_id]["action"]}", '
+            "the connection was reset"
+        )
+        self._pending.pop(request_id, None)
+        self._sent.discard(request_id)
+
+        self._reader_task = None
+        conn.transport.abort()
+        if self.reconnect_handler is None:
+            self._fail_all(exc)
+        else:
+            self._connection_lost(conn, exc)
+
+    async def _reconnect(self) -> None:
+        assert self.reconnect_handler is not None
+
+        while True:
+            try:
+                conn = await self.reconnect_handler()
+            except Exception as exc:
+                # Gave up: carry on like a dispatcher without a handler.
+                self.reconnect_handler = None
+                for request_id in list(self._pending):
+                    self._fail_lost(request_id, exc)
+                self._sent.clear()
+                self._replay.clear()
+                if self.reconnect_failed_handler is not None:
+                    self.reconnect_failed_handler(exc)
+                return
+
+            # The new connection was set up through its own dispatcher, which
+            # must stop reading before this one takes the connection over.
+            await conn.dispatcher.close()
+            self.conn = conn
+            self.codec = conn.dispatcher.codec
+            self.supports_batch = conn.dispatcher.supports_batch
+            self.supports_ranged_download = conn.dispatcher.supports_ranged_download
+            self.supports_resumable_upload = (
+                conn.dispatcher.supports_resumable_upload
+            )
+            self.supports_deduplicated_upload = (
+                conn.dispatcher.supports_deduplicated_upload
+            )
+            replay = [i for i in self._replay if i in self._pending]
+            try:
+                for request_id in replay:
+                    await self._send(conn, request_id)
+            except ConnectionClosed:
+                self._sent.clear()
+                continue
+
+            self._replay.clear()
+            break
+
+        # Responses to replayed requests are buffered by the connection
+        # until the reader starts.
+        self._reader_task = asyncio.create_task(self._read_loop(conn))
+
+    async def _send(self, conn: "LockableClientConnection", request_id: str) -> None:
+        message = self._messages[request_id]
+
+        encode_started = time.perf_counter()
+        encoded = self.codec.encode({**message, "request_id": request_id})
+        encode_time = time.perf_counter() - encode_started
+        size = len(encoded.encode()) if isinstance(encoded, str) else len(encoded)
+        metrics.record_encode(message["action"], encode_time, size)
+
+        bandwidth.upload.charge(size)
+        async with conn.lock:
+            await conn.send(encoded)
+        self._sent.add(request_id)
+
+    async def _send_and_wait(
+        self, request_id: str, future: asyncio.Future[dict[str, Any]]
+    ) -> dict[str, Any]:
+        if self.echoes_request_id:
+            return await self._exchange(request_id, future)
+
+        # The response will not say which request it answers, so the next
+        # request is only sent once this one has been answered.
+        async with self._in_turn:
+            return await self._exchange(request_id, future)
+
+    async def _exchange(
+        self, request_id: str, future: asyncio.Future[dict[str, Any]]
+    ) -> dict[str, Any]:
+        while True:
+            if self._reconnect_task is not None and self.reconnecting:
+                await asyncio.shield(self._reconnect_task)
+                if future.done():
+                    return await future
+            self._ensure_reader()
+
+            conn = self.conn
+            try:
+                await self._send(conn, request_id)
+                break
+            except ConnectionClosed as exc:
+                if self.reconnect_handler is None:
+                    raise
+                if self._messages[request_id]["action"] not in IDEMPOTENT_ACTIONS:
+                    raise ConnectionLostError(
+                        self._messages[request_id]["action"]
+                    ) from exc
+                self._connection_lost(conn, exc)
+
+        return await future
+
+    async def request(
+        self, message: dict[str, Any], timeout: Optional[float] = None
+    ) -> dict[str, Any]:
+        request_id = uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+
+        self._pending[request_id] = future
+        self._messages[request_id] = message
+
+        try:
+            return await asyncio.wait_for(
+                self._send_and_wait(request_id, future), timeout
+            )
+        except asyncio.TimeoutError:
+            if request_id in self._sent and not self.echoes_request_id:
+                self._desynchronised(request_id)
+            raise RequestTimeoutError(message["action"], timeout) from None
+        finally:
+            self._messages.pop(request_id, None)
+            self._sent.discard(request_id)
+            self._pending.pop(request_id, None)
+
+    async def close(self) -> None:
+        self.reconnect_handler = None
+        for task in (self._reconnect_task, self._reader_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
@@ -15,3 +15,25 @@ class CreateDirectoryFailureError(RequestFailureError):
     def __init__(self, name, msg, *args) -> None:
         super().__init__(*args)
         self._err_msg = f"Failed to create directory '{name}': {msg}"
+
+
+class SessionExpiredError(RequestFailureError):
+    def __init__(self, msg: str = "Session expired", response: Optional[dict] = None, *args) -> None:
+        super().__init__(msg, response, *args)
+
+
+class RequestTimeoutError(RequestFailureError):
+    def __init__(self, action: str, timeout: Optional[float], *args) -> None:
+        msg = f'Request "{action}" timed out after {timeout} seconds'
+        # Shaped like a failed response, so it is reported like one
+        super().__init__(msg, {"code": 408, "message": msg}, *args)
+        self.action = action
+        self.timeout = timeout
+
+
+class ConnectionLostError(RequestFailureError):
+    def __init__(self, action: str, *args) -> None:
+        msg = f'The connection was lost before "{action}" was answered'
+        # Shaped like a failed response, so it is reported like one
+        super().__init__(msg, {"code": 503, "message": msg}, *args)
+        self.action = action
@@ -19,3 +19,12 @@ class FileHashMismatchError(FileTransmissionException):
 
     def __str__(self) -> str:
         return f"Expected {self.expected}, got {self.got}"
+
+
+class ChunkHashMismatchError(FileTransmissionException):
+    def __init__(self, indexes: list[int], *args) -> None:
+        super().__init__(*args)
+        self.indexes = indexes
+
+    def __str__(self) -> str:
+        return f"Corrupt chunks: {', '.join(map(str, self.indexes))}"
@@ -3,9 +3,11 @@ from typing import TYPE_CHECKING
 import gettext
 import flet_permission_handler as fph
 from include.classes.config import AppConfig
+from include.classes.exceptions.request import RequestTimeoutError
 from include.constants import LOCALE_PATH, PROTOCOL_VERSION
-from include.util.connect import get_connection
-from include.util.requests import do_request
+from include.util.connect import get_connection, transfer_pool
+from include.util.dedup import recent_uploads
+from include.util.supervisor import ConnectionSupervisor, negotiate_connection
 
 if TYPE_CHECKING:
     from include.ui.controls.views.connect import ConnectForm
@@ -21,7 +23,12 @@ class ConnectFormController:
 
     async def close_previous_connection(self):
         if self.app_config.conn:
-            await self.app_config.conn.close()
+            dispatcher = self.app_config.conn.dispatcher
+            await dispatcher.close()
+            await dispatcher.conn.close()
+        await transfer_pool.close_all()
+        # What the last server held says nothing about the next one
+        recent_uploads.clear()
 
     async def action_connect(self, server_address: str):
         try:
@@ -51,7 +58,14 @@ class ConnectFormController:
             )
             return
 
-        server_info_response = await do_request(conn, "server_info")
+        try:
+            server_info_response = await negotiate_connection(conn)
+        except RequestTimeoutError as e:
+            await conn._wrapped_connection.close()
+            self.view.enable_interactions()
+            self.view.send_error(_("Connection failed: {str_err}").format(str_err=str(e)))
+            return
+
         if (
             server_protocol_version := server_info_response["data"]["protocol_version"]
         ) > PROTOCOL_VERSION:
@@ -67,6 +81,16 @@ class ConnectFormController:
             await self.view.push_route("/connect/about")
             return
 
+        # reconnect transparently if the connection drops later on
+        supervisor = ConnectionSupervisor(
+            self.view.page,
+            server_address,
+            self.view.disable_ssl_enforcement_switch.value,
+            proxy=self.app_config.preferences["settings"]["proxy_settings"],
+        )
+        conn.dispatcher.reconnect_handler = supervisor.reconnect
+        conn.dispatcher.reconnect_failed_handler = supervisor.reconnect_failed
+
         # save connection ref
         self.view.page.session.store.set("conn", conn)
 
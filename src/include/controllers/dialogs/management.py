@@ -4,7 +4,7 @@ import gettext
 import flet as ft
 from include.classes.config import AppConfig
 from include.constants import LOCALE_PATH
-from include.util.requests import do_request
+from include.util.requests import do_batch_request, do_request
 
 if TYPE_CHECKING:
     from include.ui.controls.dialogs.manage.accounts import (
@@ -107,11 +107,16 @@ class EditUserGroupDialogController:
         # Reset list
         self.view.group_listview.controls = []
 
-        # Fetch user group information
-        group_list_response = await do_request(
+        # Fetch user group information and membership concurrently
+        group_list_response, user_data_response = await do_batch_request(
             self.app_config.get_not_none_attribute("conn"),
-            action="list_groups",
-            data={},
+            [
+                {"action": "list_groups", "data": {}},
+                {
+                    "action": "get_user_info",
+                    "data": {"username": self.view.parent_dialog.username},
+                },
+            ],
             username=self.app_config.username,
             token=self.app_config.token,
         )
@@ -125,15 +130,6 @@ class EditUserGroupDialogController:
             group["name"] for group in group_list_response["data"]["groups"]
         ]
 
-        user_data_response = await do_request(
-            self.app_config.get_not_none_attribute("conn"),
-            action="get_user_info",
-            data={
-                "username": self.view.parent_dialog.username,
-            },
-            username=self.app_config.username,
-            token=self.app_config.token,
-        )
         if (code := user_data_response["code"]) != 200:
             self.view.send_error(
                 _("Failed to fetch user info: ({code}) {message}").format(code=code, message=user_data_response['message']),
@@ -1,9 +1,12 @@
 import asyncio
 import os
-from typing import TYPE_CHECKING
+import time
+from typing import TYPE_CHECKING, Optional
 import gettext
 import flet as ft
 from flet import FilePickerFile
+from websockets.exceptions import ConnectionClosed
+from include.classes.exceptions.request import RequestTimeoutError
 from include.classes.config import AppConfig
 from include.constants import LOCALE_PATH
 from include.ui.controls.dialogs.explorer import (
@@ -11,11 +14,14 @@ from include.ui.controls.dialogs.explorer import (
     UploadDirectoryAlertDialog,
 )
 from include.ui.util.path import get_directory
-from include.util.connect import get_connection
+from include.util.connect import transfer_pool
 from include.util.create import create_directory
+from include.util.dedup import recent_uploads
 from include.util.path import build_directory_tree
-from include.util.requests import do_request
-from include.util.transfer import upload_file_to_server
+from include.util.requests import do_batch_request, do_request
+from include.util.resume import UploadState
+from include.util.shaping import Priority
+from include.util.transfer import calculate_sha256, upload_file_to_server
 
 if TYPE_CHECKING:
     from include.ui.controls.views.explorer import FileManagerView
@@ -23,6 +29,28 @@ if TYPE_CHECKING:
 t = gettext.translation("client", LOCALE_PATH, fallback=True)
 _ = t.gettext
 
+# Seconds between progress updates of a multi-file upload.
+PROGRESS_INTERVAL = 0.1
+# Times a resumable upload is attempted before giving up on the file.
+UPLOAD_ATTEMPTS = 5
+# Documents a directory upload creates ahead of the file being uploaded. A
+# small window leaves few empty documents when the upload is stopped, and
+# keeps tasks from expiring before their file's turn.
+CREATE_DOCUMENT_WINDOW = 4
+# Files that a multi-file upload sends at the same time. Phones get fewer, as
+# their links are slower and often metered.
+DEFAULT_UPLOAD_WORKERS = 4
+MOBILE_UPLOAD_WORKERS = 2
+
+
+def get_upload_workers(platform: str, setting: Optional[int] = None) -> int:
+    """Returns the configured upload concurrency, or the platform's default."""
+    if setting:
+        return setting
+    if platform in ["ios", "android"]:
+        return MOBILE_UPLOAD_WORKERS
+    return DEFAULT_UPLOAD_WORKERS
+
 
 class FileExplorerController:
     def __init__(self, view: "FileManagerView"):
@@ -48,90 +76,193 @@ class FileExplorerController:
             self.view.page.overlay.append(progress_column)
             self.view.page.update()
 
+        # Files are uploaded by a few workers at the same time, so that many
+        # small files do not wait for each other's round trips.
+        assert self.view.page.platform
+        upload_workers = get_upload_workers(
+            self.view.page.platform.value,
+            self.app_config.preferences["settings"].get("upload_workers"),
+        )
+        pending_files: asyncio.Queue[FilePickerFile] = asyncio.Queue()
         for each_file in files:
-            if stop_event.is_set():
-                break
+            pending_files.put_nowait(each_file)
+
+        total_size = sum(each_file.size for each_file in files)
+        sent_sizes: dict[int, int] = {}
+        finished_number = 0
+        last_refreshed = 0.0
+        permission_denied = False
+
+        def refresh_progress(force: bool = False):
+            nonlocal last_refreshed
+            now = time.perf_counter()
+            if not force and now - last_refreshed < PROGRESS_INTERVAL:
+                return
+            last_refreshed = now
 
+            sent_size = sum(sent_sizes.values())
+            progress_bar.value = sent_size / total_size if total_size else None
+            progress_info.value = (
+                f"{sent_size / 1024 / 1024:.2f} MB/{total_size / 1024 / 1024:.2f} MB"
+            )
             if len(files) > 1:
-                current_number = files.index(each_file) + 1
+                progress_info.value = (
+                    _("Uploading file [{current}/{total}]").format(
+                        current=min(finished_number + 1, len(files)),
+                        total=len(files),
+                    )
+                    + "\n"
+                    + progress_info.value
+                )
+            progress_column.update()
 
-                progress_bar.value = current_number / len(files)
-                progress_info.value = _("Uploading file [{current}/{total}]").format(
-                    current=current_number, total=len(files)
+        def add_error(errmsg: str):
+            if progress_column not in self.view.page.overlay:
+                progress_column.controls.append(
+                    ft.Text(errmsg, text_align=ft.TextAlign.CENTER)
                 )
                 progress_column.update()
+            else:
+                self.view.send_error(errmsg)
+
+        folder_id = self.view.current_directory_id
+        dispatcher = self.app_config.get_not_none_attribute("conn").dispatcher
+        resumable = dispatcher.supports_resumable_upload
+        deduplicating = dispatcher.supports_deduplicated_upload
+
+        async def create_upload_task(each_file: FilePickerFile) -> dict | None:
+            nonlocal permission_denied
+
+            data = {
+                "title": each_file.name,
+                "folder_id": folder_id,
+                "access_rules": {},
+            }
+            if deduplicating and recent_uploads and each_file.path:
+                data |= await self._get_known_content(each_file.path)
 
             response = await do_request(
                 self.app_config.get_not_none_attribute("conn"),
                 action="create_document",
-                data={
-                    "title": each_file.name,
-                    "folder_id": self.view.current_directory_id,
-                    "access_rules": {},
-                },
+                data=data,
                 username=self.app_config.username,
                 token=self.app_config.token,
             )
 
             if (code := response["code"]) != 200:
                 if code == 403:
-                    self.view.send_error(
-                        _("Upload failed: No permission to upload files")
-                    )
-
-                    return
+                    # No point in trying the other files
+                    permission_denied = True
+                    stop_event.set()
                 else:
-                    errmsg = _("Upload failed: ({code}) {message}").format(
-                        code=response["code"], message=response["message"]
-                    )
-                    if progress_column not in self.view.page.overlay:
-                        _new_error_text = ft.Text(
-                            errmsg,
-                            text_align=ft.TextAlign.CENTER,
-                            # color=ft.Colors.RED,
-                        )
-                        progress_column.controls.append(_new_error_text)
-                    else:
-                        self.view.send_error(
-                            errmsg,
+                    add_error(
+                        _("Upload failed: ({code}) {message}").format(
+                            code=response["code"], message=response["message"]
                         )
-                    continue
+                    )
+                return None
 
-            task_id = response["data"]["task_data"]["task_id"]
+            if (task_data := response["data"].get("task_data")) is not None:
+                if resumable and each_file.path:
+                    self._record_upload(
+                        task_data, each_file.path, folder_id, each_file.name
+                    )
+            return response["data"]
+
+        async def handle_file_upload(each_file: FilePickerFile):
+            # Continue an unfinished upload of the same file, if there is one
+            state = None
+            if resumable and each_file.path:
+                state = UploadState.find(each_file.path, folder_id, each_file.name)
+            task_id = state.task_id if state is not None else None
+
+            attempt = 1
+            while True:
+                if task_id is None:
+                    if (created := await create_upload_task(each_file)) is None:
+                        return
+                    if "task_data" not in created:
+                        # Created from content the server already holds
+                        sent_sizes[each_file.id] = each_file.size
+                        return
+                    task_id = created["task_data"]["task_id"]
 
-            async def handle_file_upload(task_id):  # need abstract
                 conn = None
+                completed = False
+                started = False
 
                 try:
                     assert each_file.path
-                    # get new connection
-                    conn = await get_connection(self.app_config.server_address)
+                    # borrow a transfer connection
+                    conn = await transfer_pool.acquire(self.app_config.server_address)
 
                     async for current_size, file_size in upload_file_to_server(
-                        conn, task_id, each_file.path
+                        conn,
+                        task_id,
+                        each_file.path,
+                        resume=resumable,
+                        dedup=deduplicating,
                     ):
-                        progress_bar.value = current_size / file_size
-                        progress_info.value = f"{current_size / 1024 / 1024:.2f} MB/{file_size / 1024 / 1024:.2f} MB"
-                        progress_column.update()
+                        started = True
+                        sent_sizes[each_file.id] = current_size
+                        refresh_progress()
                         if stop_event.is_set():
                             break
+                    else:
+                        completed = True
+
+                    if completed and not started and state is not None:
+                        # The server refused the old task, e.g. as it expired
+                        # there; upload the file as a new document instead.
+                        state = task_id = None
+                        continue
+                    return
+
+                except (ConnectionClosed, ConnectionError, RequestTimeoutError) as exc:
+                    # The server keeps what it has received, continue from there
+                    if resumable and attempt < UPLOAD_ATTEMPTS:
+                        attempt += 1
+                        await asyncio.sleep(attempt)
+                        continue
+                    add_error(
+                        _(
+                            'Problem occurred when uploading "{each_file_name}": {exc}'
+                        ).format(each_file_name=each_file.name, exc=exc)
+                    )
+                    return
 
                 except Exception as exc:
-                    _new_error_text = ft.Text(
+                    add_error(
                         _(
                             'Problem occurred when uploading "{each_file_name}": {exc}'
-                        ).format(each_file_name=each_file.name, exc=exc),
-                        text_align=ft.TextAlign.CENTER,
+                        ).format(each_file_name=each_file.name, exc=exc)
                     )
-                    progress_column.controls.append(_new_error_text)
                     return
 
                 finally:
                     if conn:
-                        await conn._wrapped_connection.close()  # bug: timeout when calling conn.close()
-                        # await asyncio.wait_for(conn.close(), timeout=2) # issue: timeout
+                        await transfer_pool.release(conn, discard=not completed)
 
-            await handle_file_upload(task_id)
+        async def run_upload_worker():
+            nonlocal finished_number
+            while not stop_event.is_set():
+                try:
+                    each_file = pending_files.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await handle_file_upload(each_file)
+                finished_number += 1
+                refresh_progress(force=True)
+
+        await asyncio.gather(
+            *(
+                run_upload_worker()
+                for _worker in range(min(upload_workers, len(files)))
+            )
+        )
+
+        if permission_denied:
+            self.view.send_error(_("Upload failed: No permission to upload files"))
 
         if len(files) > 1:
             if len(progress_column.controls) <= 2:
@@ -150,6 +281,31 @@ class FileExplorerController:
             view=self.view.file_listview,
         )
 
+    async def _get_known_content(self, file_path: str) -> dict:
+        """
+        Returns the hash and size of the file for ``create_document`` if the
+        server is known to hold its content, so that no upload is needed.
+        """
+        file_size = os.path.getsize(file_path)
+        if not file_size:
+            return {}
+        sha256 = await calculate_sha256(file_path, cached=True)
+        if (sha256, file_size) not in recent_uploads:
+            return {}
+        return {"sha256": sha256, "size": file_size}
+
+    def _record_upload(
+        self, task_data: dict, file_path: str, folder_id: str | None, title: str
+    ) -> None:
+        # Remember the task, so that the upload can be continued after a restart
+        UploadState(
+            task_data["task_id"],
+            file_path,
+            folder_id,
+            title,
+            end_time=task_data.get("end_time"),
+        ).save()
+
     async def action_directory_upload(self, root_path: str):
         tree = await build_directory_tree(root_path)
 
@@ -187,6 +343,54 @@ class FileExplorerController:
                 dir_path = os.path.join(parent_path, dirname)
                 await create_dirs_from_tree(dir_path, subtree, dir_id)
 
+            # Files whose upload was interrupted continue on their old task
+            resumable = conn.dispatcher.supports_resumable_upload
+            task_ids: dict[str, str] = {}
+            if resumable:
+                for filename in tree["files"]:
+                    state = UploadState.find(
+                        os.path.join(parent_path, filename), dir_id, filename
+                    )
+                    if state is not None:
+                        task_ids[filename] = state.task_id
+            resumed_filenames = set(task_ids)
+
+            deduplicating = conn.dispatcher.supports_deduplicated_upload
+            new_filenames = [f for f in tree["files"] if f not in task_ids]
+            create_document_responses: dict[str, dict] = {}
+
+            async def create_documents(filenames: list[str]) -> None:
+                # Documents of content the server already holds need no upload
+                known_contents: dict[str, dict] = {}
+                if deduplicating and recent_uploads:
+                    for filename in filenames:
+                        known_contents[filename] = await self._get_known_content(
+                            os.path.join(parent_path, filename)
+                        )
+
+                try:
+                    responses = await do_batch_request(
+                        conn,
+                        [
+                            {
+                                "action": "create_document",
+                                "data": {
+                                    "title": filename,
+                                    "folder_id": dir_id,
+                                    "access_rules": {},
+                                }
+                                | known_contents.get(filename, {}),
+                            }
+                            for filename in filenames
+                        ],
+                        username=self.app_config.username,
+                        token=self.app_config.token,
+                    )
+                except (ConnectionClosed, ConnectionError) as exc:
+                    # Only this window fails, the next one is tried afresh
+                    responses = [{"message": str(exc)}] * len(filenames)
+                create_document_responses.update(zip(filenames, responses))
+
             # Upload files sequentially
 
             for filename in tree["files"]:
@@ -195,6 +399,19 @@ class FileExplorerController:
                 if stop_event.is_set():
                     return
 
+                if (
+                    filename in new_filenames
+                    and filename not in create_document_responses
+                ):
+                    # Create the next few documents in one round trip
+                    index = new_filenames.index(filename)
+                    await create_documents(
+                        new_filenames[index : index + CREATE_DOCUMENT_WINDOW]
+                    )
+                create_document_response = create_document_responses.get(
+                    filename, {"code": 200}
+                )
+
                 abs_path = os.path.join(parent_path, filename)
 
                 _current_number = tree["files"].index(filename) + 1
@@ -211,18 +428,6 @@ class FileExplorerController:
                 upload_dialog.progress_bar.value = _current_number / _total_number
                 upload_dialog.progress_column.update()
 
-                create_document_response = await do_request(
-                    conn,
-                    action="create_document",
-                    data={
-                        "title": filename,
-                        "folder_id": dir_id,
-                        "access_rules": {},
-                    },
-                    username=self.app_config.username,
-                    token=self.app_config.token,
-                )
-
                 if create_document_response.get("code") != 200:
                     upload_dialog.error_column.controls.append(
                         ft.Text(
@@ -235,27 +440,95 @@ class FileExplorerController:
                         )
                     )
                     upload_dialog.error_column.update()
+                    continue
+
+                if filename not in task_ids and "task_data" not in (
+                    create_document_response.get("data") or {}
+                ):
+                    # Created from content the server already holds
+                    continue
+
+                if filename not in task_ids:
+                    task_data = create_document_response["data"]["task_data"]
+                    task_ids[filename] = task_data["task_id"]
+                    if resumable:
+                        self._record_upload(task_data, abs_path, dir_id, filename)
 
-                max_retries = 2
+                # Retries of a resumable upload continue where it stopped
+                max_retries = UPLOAD_ATTEMPTS if resumable else 2
 
-                for retry in range(1, max_retries + 1):
+                retry = 0
+                while retry < max_retries:
+                    retry += 1
                     transfer_conn = None
+                    completed = False
+                    started = False
                     try:
-                        transfer_conn = await get_connection(
+                        transfer_conn = await transfer_pool.acquire(
                             self.app_config.server_address,
                             max_size=1024**2 * 4,
                         )
                         async for current_size, file_size in upload_file_to_server(
                             transfer_conn,
-                            create_document_response["data"]["task_data"]["task_id"],
+                            task_ids[filename],
                             abs_path,
+                            # Directory uploads give way to other transfers
+                            priority=Priority.BACKGROUND,
+                            resume=resumable,
+                            dedup=deduplicating,
                         ):
+                            started = True
                             upload_dialog.progress_bar.value = current_size / file_size
                             upload_dialog.progress_text.value = f"{current_size / 1024 / 1024:.2f} MB/{file_size / 1024 / 1024:.2f} MB"
                             upload_dialog.progress_column.update()
                             if stop_event.is_set():
                                 break
-                        await transfer_conn._wrapped_connection.close()
+                        else:
+                            completed = True
+
+                        if completed and not started and filename not in resumed_filenames:
+                            # A task created just now should not be refused
+                            upload_dialog.error_column.controls.append(
+                                ft.Text(
+                                    _(
+                                        'The server refused the upload of file "{filename}"'
+                                    ).format(filename=filename)
+                                )
+                            )
+                            upload_dialog.error_column.update()
+                        elif completed and not started:
+                            # The server refused the old task, e.g. as it
+                            # expired there; upload as a new document instead.
+                            resumed_filenames.discard(filename)
+                            response = await do_request(
+                                conn,
+                                action="create_document",
+                                data={
+                                    "title": filename,
+                                    "folder_id": dir_id,
+                                    "access_rules": {},
+                                },
+                                username=self.app_config.username,
+                                token=self.app_config.token,
+                            )
+                            if response["code"] == 200:
+                                task_data = response["data"]["task_data"]
+                                task_ids[filename] = task_data["task_id"]
+                                self._record_upload(
+                                    task_data, abs_path, dir_id, filename
+                                )
+                                # The new task gets attempts of its own
+                                retry = 0
+                                continue
+                            upload_dialog.error_column.controls.append(
+                                ft.Text(
+                                    _('Create file "{filename}" failed: {errmsg}').format(
+                                        filename=filename,
+                                        errmsg=response.get("message", "Unknown error"),
+                                    )
+                                )
+                            )
+                            upload_dialog.error_column.update()
                         break
                     except (
                         Exception
@@ -281,6 +554,11 @@ class FileExplorerController:
 
                             upload_dialog.progress_text.update()
                         continue
+                    finally:
+                        if transfer_conn:
+                            await transfer_pool.release(
+                                transfer_conn, discard=not completed
+                            )
 
         upload_dialog.progress_text.value = _("Please wait")
         upload_dialog.progress_text.update()
@@ -2,6 +2,7 @@ import flet as ft
 import json, gettext
 from include.classes.config import AppConfig
 from include.constants import LOCALE_PATH
+from include.ui.controls.dialogs.diagnostics import DiagnosticsDialog
 from include.util.requests import do_request
 from include.ui.util.notifications import send_error
 
@@ -34,6 +35,7 @@ class DevRequestDialog(ft.AlertDialog):
             width=720,
         )
         self.actions = [
+            ft.TextButton(_("Diagnostics"), on_click=self.diagnostics_button_click),
             ft.TextButton(_("Submit"), on_click=self.on_submit_button_clicked),
             ft.TextButton(_("Cancel"), on_click=self.cancel_button_click),
         ]
@@ -43,6 +45,12 @@ class DevRequestDialog(ft.AlertDialog):
         self.open = False
         self.update()
 
+    async def diagnostics_button_click(self, event: ft.Event[ft.TextButton]):
+        assert self.page
+        self.open = False
+        self.update()
+        self.page.show_dialog(DiagnosticsDialog())
+
     async def on_submit_button_clicked(self, event: ft.Event[ft.TextButton]):
         assert self.page
         request_name: str | None = self.req_name.value
@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import gettext
+import flet as ft
+from include.constants import FLET_APP_STORAGE_DATA, LOCALE_PATH
+from include.ui.controls.dialogs.base import AlertDialog
+from include.ui.util.notifications import send_success
+from include.util.metrics import metrics
+
+t = gettext.translation("client", LOCALE_PATH, fallback=True)
+_ = t.gettext
+
+DIAGNOSTICS_PATH = f"{FLET_APP_STORAGE_DATA}/diagnostics"
+
+
+def _format_latency(value: float | None) -> str:
+    return f"{value:.1f}" if value is not None else "-"
+
+
+class DiagnosticsDialog(AlertDialog):
+    def __init__(
+        self,
+        ref: ft.Ref | None = None,
+        visible=True,
+    ):
+        super().__init__(ref=ref, visible=visible)
+
+        self.title = ft.Text(_("Protocol Diagnostics"))
+        self.summary_text = ft.Text()
+        self.metrics_listview = ft.ListView(expand=True, spacing=8)
+        self.content = ft.Column(
+            [self.summary_text, self.metrics_listview],
+            width=720,
+            height=480,
+        )
+        self.actions = [
+            ft.TextButton(_("Refresh"), on_click=self.refresh_button_click),
+            ft.TextButton(_("Reset"), on_click=self.reset_button_click),
+            ft.TextButton(_("Export"), on_click=self.export_button_click),
+            ft.TextButton(_("Close"), on_click=self.close_button_click),
+        ]
+        self.scrollable = True
+        self.load_metrics()
+
+    def load_metrics(self):
+        snapshot = metrics.snapshot()
+        self.summary_text.value = _(
+            "Collecting since {started_at}, {total} action(s) recorded"
+        ).format(
+            started_at=time.strftime(
+                "%Y-%m-%d %H:%M:%S", time.localtime(snapshot["started_at"])
+            ),
+            total=len(snapshot["actions"]),
+        )
+
+        self.metrics_listview.controls = []
+        for action, entry in snapshot["actions"].items():
+            latency = entry["latency_ms"]
+            details = _(
+                "count {count}, errors {errors} | "
+                "p50/p95/p99 {p50}/{p95}/{p99} ms | "
+                "out {bytes_out} B, in {bytes_in} B | "
+                "encode {encode_ms:.1f} ms, decode {decode_ms:.1f} ms"
+            ).format(
+                count=entry["count"],
+                errors=entry["errors"],
+                p50=_format_latency(latency["p50"]),
+                p95=_format_latency(latency["p95"]),
+                p99=_format_latency(latency["p99"]),
+                bytes_out=entry["bytes_out"],
+                bytes_in=entry["bytes_in"],
+                encode_ms=entry["encode_ms"],
+                decode_ms=entry["decode_ms"],
+            )
+            if entry["throughput_mbps"] is not None:
+                details += " | " + _("{throughput:.2f} MB/s").format(
+                    throughput=entry["throughput_mbps"]
+                )
+            self.metrics_listview.controls.append(
+                ft.ListTile(title=ft.Text(action), subtitle=ft.Text(details))
+            )
+
+    async def refresh_button_click(self, event: ft.Event[ft.TextButton]):
+        self.load_metrics()
+        self.update()
+
+    async def reset_button_click(self, event: ft.Event[ft.TextButton]):
+        metrics.reset()
+        self.load_metrics()
+        self.update()
+
+    async def export_button_click(self, event: ft.Event[ft.TextButton]):
+        os.makedirs(DIAGNOSTICS_PATH, exist_ok=True)
+        export_path = (
+            f"{DIAGNOSTICS_PATH}/metrics_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        )
+        with open(export_path, "w", encoding="utf-8") as f:
+            json.dump(metrics.snapshot(), f, ensure_ascii=False, indent=2)
+        send_success(
+            self.page, _("Metrics exported to {path}").format(path=export_path)
+        )
+
+    async def close_button_click(self, event: ft.Event[ft.TextButton]):
+        self.close()
@@ -11,6 +11,8 @@ from include.classes.config import AppConfig
 from include.constants import FLET_APP_STORAGE_TEMP, LOCALE_PATH, RUNTIME_PATH
 from include.ui.controls.dialogs.base import AlertDialog
 from include.ui.util.notifications import send_error
+from include.classes.exceptions.transmission import FileHashMismatchError
+from include.util.hashing import StreamHasher
 from include.util.transfer import calculate_sha256
 from include.util.upgrade.updater import AssetDigest, AssetDigestType
 
@@ -193,6 +195,7 @@ exit
             if response.status_code == 200:
                 total_size = int(response.headers.get("content-length", 0))
                 downloaded_size = 0
+                hasher = StreamHasher()
 
                 with open(f"{FLET_APP_STORAGE_TEMP}/{self.save_filename}", "wb") as f:
                     for chunk in response.iter_content(chunk_size=8192):
@@ -200,6 +203,7 @@ exit
                             break
                         if chunk:
                             f.write(chunk)
+                            hasher.update(chunk)
                             downloaded_size += len(chunk)
 
                             # Update progress
@@ -224,8 +228,24 @@ exit
                     except FileNotFoundError:
                         pass
                     return False
-                else:
-                    return True
+
+                if (
+                    self.asset_digest
+                    and self.asset_digest.type == AssetDigestType.SHA256
+                ):
+                    try:
+                        hasher.verify(self.asset_digest.digest)
+                    except FileHashMismatchError as exc:
+                        os.remove(target_path)
+                        send_error(
+                            self.page,
+                            _("Update package hash mismatch: {exc}").format(
+                                exc=str(exc)
+                            ),
+                        )
+                        return False
+
+                return True
             else:
                 send_error(
                     self.page,
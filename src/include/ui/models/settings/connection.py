@@ -1,10 +1,15 @@
 from typing import Literal
+import os
 import flet as ft
 from flet_model import Model, route
 
 from include.classes.config import AppConfig
+from include.controllers.explorer import get_upload_workers
 from include.ui.util.notifications import send_success
 from include.ui.util.route import get_parent_route
+from include.util.cache import document_cache
+from include.util.shaping import bandwidth
+from include.util.workers import DEFAULT_CRYPTO_WORKERS, crypto_executor
 
 
 @route("conn_settings")
@@ -41,10 +46,68 @@ class ConnectionSettingsModel(Model):
             expand_loose=True,
         )
 
+        self.download_connections_slider = ft.Slider(
+            min=1,
+            max=4,
+            divisions=3,
+            label="{value}",
+        )
+
+        self.upload_workers_slider = ft.Slider(
+            min=1,
+            max=4,
+            divisions=3,
+            label="{value}",
+        )
+
+        self.crypto_workers_slider = ft.Slider(
+            min=1,
+            max=max(os.cpu_count() or 1, 2),
+            divisions=max(os.cpu_count() or 1, 2) - 1,
+            label="{value}",
+        )
+
+        self.upload_limit_textfield = ft.TextField(
+            label="Upload limit (KB/s)",
+            hint_text="0 for unlimited",
+            input_filter=ft.NumbersOnlyInputFilter(),
+            expand=True,
+            expand_loose=True,
+        )
+        self.download_limit_textfield = ft.TextField(
+            label="Download limit (KB/s)",
+            hint_text="0 for unlimited",
+            input_filter=ft.NumbersOnlyInputFilter(),
+            expand=True,
+            expand_loose=True,
+        )
+
+        self.document_cache_size_textfield = ft.TextField(
+            label="Document cache size (MB)",
+            input_filter=ft.NumbersOnlyInputFilter(),
+            expand=True,
+            expand_loose=True,
+        )
+        self.document_cache_stats_text = ft.Text()
+        self.clear_document_cache_button = ft.TextButton(
+            "Clear document cache", on_click=self.clear_cache_click
+        )
+
         self.controls = [
             self.enable_proxy_switch,
             self.follow_system_proxy_switch,
             self.custom_proxy_textfield,
+            ft.Text("Parallel download connections"),
+            self.download_connections_slider,
+            ft.Text("Parallel file uploads"),
+            self.upload_workers_slider,
+            ft.Text("Decryption and hashing threads"),
+            self.crypto_workers_slider,
+            self.upload_limit_textfield,
+            self.download_limit_textfield,
+            self.document_cache_size_textfield,
+            self.document_cache_stats_text,
+            self.clear_document_cache_button,
         ]
 
     def did_mount(self) -> None:
@@ -71,9 +134,48 @@ class ConnectionSettingsModel(Model):
             proxy_settings_value = None
 
         self.app_config.preferences["settings"]["proxy_settings"] = proxy_settings_value
+        self.app_config.preferences["settings"]["download_connections"] = int(
+            self.download_connections_slider.value
+        )
+        # Left unset, the number of upload workers follows the platform
+        upload_workers = int(self.upload_workers_slider.value)
+        assert self.page.platform
+        if upload_workers != get_upload_workers(
+            self.page.platform.value,
+            self.app_config.preferences["settings"].get("upload_workers"),
+        ):
+            self.app_config.preferences["settings"]["upload_workers"] = upload_workers
+        crypto_workers = int(self.crypto_workers_slider.value)
+        self.app_config.preferences["settings"]["crypto_workers"] = crypto_workers
+        crypto_executor.resize(crypto_workers)
+        upload_limit = int(self.upload_limit_textfield.value or 0)
+        download_limit = int(self.download_limit_textfield.value or 0)
+        self.app_config.preferences["settings"]["upload_limit"] = upload_limit
+        self.app_config.preferences["settings"]["download_limit"] = download_limit
+        bandwidth.configure(upload_limit * 1024, download_limit * 1024)
+        document_cache_size = int(self.document_cache_size_textfield.value or 0)
+        self.app_config.preferences["settings"][
+            "document_cache_size"
+        ] = document_cache_size
+        document_cache.resize(document_cache_size * 1024**2)
         self.app_config.dump_preferences()
+        self.update_cache_stats()
         send_success(self.page, "Settings Saved.")
 
+    async def clear_cache_click(self, event: ft.Event[ft.TextButton]):
+        document_cache.clear()
+        self.update_cache_stats()
+        send_success(self.page, "Document cache cleared.")
+
+    def update_cache_stats(self):
+        stats = document_cache.stats
+        self.document_cache_stats_text.value = (
+            f"Cache hit rate: {stats['hit_rate']:.0%} of {stats['hits'] + stats['misses']} opens, "
+            f"{stats['bytes_saved'] / 1024 / 1024:.2f} MB saved, "
+            f"{stats['size'] / 1024 / 1024:.2f} MB used"
+        )
+        self.update()
+
     async def switch_click(self, event: ft.Event[ft.Switch]):
         await self.flush_switch()
 
@@ -86,6 +188,27 @@ class ConnectionSettingsModel(Model):
         self.custom_proxy_textfield.value = self.app_config.preferences["settings"].get(
             "custom_proxy", ""
         )
+        self.download_connections_slider.value = self.app_config.preferences[
+            "settings"
+        ].get("download_connections", 4)
+        assert self.page.platform
+        self.upload_workers_slider.value = get_upload_workers(
+            self.page.platform.value,
+            self.app_config.preferences["settings"].get("upload_workers"),
+        )
+        self.crypto_workers_slider.value = self.app_config.preferences["settings"].get(
+            "crypto_workers", DEFAULT_CRYPTO_WORKERS
+        )
+        self.upload_limit_textfield.value = str(
+            self.app_config.preferences["settings"].get("upload_limit", 0)
+        )
+        self.download_limit_textfield.value = str(
+            self.app_config.preferences["settings"].get("download_limit", 0)
+        )
+        self.document_cache_size_textfield.value = str(
+            self.app_config.preferences["settings"].get("document_cache_size", 512)
+        )
+        self.update_cache_stats()
         await self.flush_switch()
 
     async def flush_switch(self):
@@ -41,7 +41,10 @@ def update_file_controls(
 
     async def document_listtile_click(event: ft.Event[ft.ListTile]):
         await get_document(
-            event.control.data[0], filename=event.control.data[1], view=view
+            event.control.data[0],
+            filename=event.control.data[1],
+            view=view,
+            last_modified=event.control.data[2],
         )
 
     async def document_right_click(
@@ -118,7 +121,11 @@ def update_file_controls(
                         )
                     ),
                     is_three_line=True,
-                    data=(document["id"], document["title"]),
+                    data=(
+                        document["id"],
+                        document["title"],
+                        document["last_modified"],
+                    ),
                     on_click=document_listtile_click,
                 ),
                 on_secondary_tap=document_right_click,
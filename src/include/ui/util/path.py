@@ -1,17 +1,26 @@
 from typing import TYPE_CHECKING, Optional
+import asyncio
 import os
 import gettext
 import flet as ft
-from include.classes.exceptions.request import RequestFailureError
+from websockets.exceptions import ConnectionClosed
+from include.classes.exceptions.request import (
+    RequestFailureError,
+    RequestTimeoutError,
+)
 from include.classes.exceptions.transmission import (
+    ChunkHashMismatchError,
     FileHashMismatchError,
     FileSizeMismatchError,
 )
+from include.classes.config import AppConfig
 from include.constants import LOCALE_PATH
 from include.ui.util.notifications import send_error
 from include.util.requests import do_request
-from include.util.connect import get_connection
-from include.util.transfer import receive_file_from_server
+from include.util.cache import document_cache
+from include.util.connect import transfer_pool
+from include.util.resume import discard_download
+from include.util.transfer import receive_file_from_server, receive_file_segmented
 
 if TYPE_CHECKING:
     from include.ui.controls.views.explorer import FileListView
@@ -19,6 +28,9 @@ if TYPE_CHECKING:
 t = gettext.translation("client", LOCALE_PATH, fallback=True)
 _ = t.gettext
 
+# Times a download is attempted before giving up on the task.
+DOWNLOAD_ATTEMPTS = 5
+
 
 async def get_directory(
     id: str | None,
@@ -73,8 +85,57 @@ async def get_directory(
     view.update()
 
 
-async def get_document(id: str | None, filename: str, view: "FileListView"):
+def _get_download_path(view: "FileListView", filename: str) -> str:
+    assert view.page.platform
+    if view.page.platform.value in ["android"]:
+        return f"/storage/emulated/0/{filename}"
+    else:
+        return f"./{filename}"
+
+
+async def get_document(
+    id: str | None,
+    filename: str,
+    view: "FileListView",
+    last_modified: Optional[float] = None,
+):
+    """
+    Downloads the document, or copies it from the document cache if it is
+    unchanged. ``last_modified`` is the time given in the directory listing,
+    under which a document that is not cached yet is added to the cache.
+    """
     assert type(view.page) == ft.Page
+
+    server_address = view.page.session.store.get("server_uri")
+    if id is not None:
+        if document_cache.holds(server_address, id):
+            # Revalidate a cached copy with the document's metadata, which is
+            # much cheaper than transferring the document again.
+            info_response = await do_request(
+                view.parent_manager.conn,
+                action="get_document_info",
+                data={"document_id": id},
+                username=view.page.session.store.get("username"),
+                token=view.page.session.store.get("token"),
+            )
+            last_modified = (
+                info_response["data"]["last_modified"]
+                if info_response["code"] == 200
+                else None
+            )
+        if last_modified is not None:
+            try:
+                if await document_cache.restore(
+                    server_address,
+                    id,
+                    last_modified,
+                    _get_download_path(view, filename or id[0:17]),
+                ):
+                    return
+            except OSError:
+                # Fall back to downloading the document
+                pass
+
     response = await do_request(
         view.parent_manager.conn,
         action="get_document",
@@ -82,21 +143,32 @@ async def get_document(id: str | None, filename: str, view: "FileListView"):
         username=view.page.session.store.get("username"),
         token=view.page.session.store.get("token"),
     )
+    if (code := response["code"]) != 200:
+        send_error(
+            view.page,
+            _("Download failed: ({code}) {message}").format(
+                code=code, message=response["message"]
+            ),
+        )
+        return
 
     task_data = response["data"]["task_data"]
     task_id = task_data["task_id"]
     task_start_time = task_data["start_time"]
     task_end_time = task_data["end_time"]
 
-    assert view.page.platform
-    if view.page.platform.value in ["android"]:
-        file_path = f"/storage/emulated/0/{filename if filename else task_id[0:17]}"
-    else:
-        file_path = f"./{filename if filename else task_id[0:17]}"
+    file_path = _get_download_path(view, filename if filename else task_id[0:17])
 
-    transfer_conn = await get_connection(
-        view.page.session.store.get("server_uri"), max_size=1024**2 * 4
+    # Servers with ranged tasks can serve a download over several connections
+    download_connections: int = AppConfig().preferences["settings"].get(
+        "download_connections", 4
+    )
+    segmented = (
+        view.parent_manager.conn.dispatcher.supports_ranged_download
+        and download_connections > 1
     )
+    completed = False
+    sha256: Optional[str] = None
 
     # build progress bar
 
@@ -113,38 +185,100 @@ async def get_document(id: str | None, filename: str, view: "FileListView"):
     view.page.update()
 
     try:
-        async for stage, *data in receive_file_from_server(
-            transfer_conn, task_id=task_id, file_path=file_path
-        ):
-            match stage:
-                case 0:
-                    received_file_size, file_size = data
-                    progress_bar.value = received_file_size / file_size
-                    progress_info.value = (
-                        f"{received_file_size / 1024 / 1024:.2f} MB"
-                        f"/{file_size / 1024 / 1024:.2f} MB"
+        attempt = 1
+        while True:
+            transfer_conn = None
+            try:
+                if segmented:
+                    transfer = receive_file_segmented(
+                        transfer_pool,
+                        server_address,
+                        task_id=task_id,
+                        file_path=file_path,
+                        max_connections=download_connections,
+                        max_size=1024**2 * 4,
                     )
-                case 1:
-                    decrypted_chunks, total_chunks = data
-                    progress_bar.value = decrypted_chunks / total_chunks
-                    progress_info.value = _(
-                        "Decrypting chunk [{decrypted_chunks}/{total_chunks}]"
-                    ).format(
-                        decrypted_chunks=decrypted_chunks,
-                        total_chunks=total_chunks,
+                else:
+                    transfer_conn = await transfer_pool.acquire(
+                        server_address,
+                        max_size=1024**2 * 4,
                     )
-                case 2:
-                    progress_bar.value = None
-                    progress_info.value = _("Deleting temporary files")
-                case 3:
-                    progress_bar.value = None
-                    progress_info.value = _("Verifying file")
-
-            progress_column.update()
+                    transfer = receive_file_from_server(
+                        transfer_conn, task_id=task_id, file_path=file_path, resume=True
+                    )
+                async for stage, *data in transfer:
+                    match stage:
+                        case 0:
+                            received_file_size, file_size = data
+                            progress_bar.value = received_file_size / file_size
+                            progress_info.value = (
+                                f"{received_file_size / 1024 / 1024:.2f} MB"
+                                f"/{file_size / 1024 / 1024:.2f} MB"
+                            )
+                        case 1:
+                            decrypted_chunks, total_chunks = data
+                            progress_bar.value = decrypted_chunks / total_chunks
+                            progress_info.value = _(
+                                "Decrypting chunk [{decrypted_chunks}/{total_chunks}]"
+                            ).format(
+                                decrypted_chunks=decrypted_chunks,
+                                total_chunks=total_chunks,
+                            )
+                        case 2:
+                            progress_bar.value = None
+                            progress_info.value = _("Deleting temporary files")
+                        case 3:
+                            (sha256,) = data
+                            progress_bar.value = None
+                            progress_info.value = _("Verifying file")
+
+                    progress_column.update()
+                completed = True
+                break
+            except (
+                ConnectionClosed,
+                ConnectionError,
+                TimeoutError,
+                RequestTimeoutError,
+                ChunkHashMismatchError,
+            ):
+                # The partial download is kept, continue it on a new connection
+                if attempt >= DOWNLOAD_ATTEMPTS:
+                    raise
+                attempt += 1
+                progress_bar.value = None
+                progress_info.value = _(
+                    "Transfer interrupted, resuming download ({attempt}/{attempts})"
+                ).format(attempt=attempt, attempts=DOWNLOAD_ATTEMPTS)
+                progress_column.update()
+                await asyncio.sleep(attempt)
+            finally:
+                if transfer_conn is not None:
+                    await transfer_pool.release(transfer_conn, discard=not completed)
+
+        if id is not None and last_modified is not None and sha256:
+            try:
+                await document_cache.store(
+                    server_address, id, last_modified, sha256, file_path
+                )
+            except OSError:
+                # Caching is best effort
+                pass
+    except ChunkHashMismatchError as exc:
+        send_error(view.page, _("Corrupt download: {exc}").format(exc=str(exc)))
     except FileHashMismatchError as exc:
         send_error(view.page, _("File hash mismatch: {exc}").format(exc=str(exc)))
     except FileSizeMismatchError as exc:
         send_error(view.page, _("File size mismatch: {exc}").format(exc=str(exc)))
+    except (ConnectionClosed, OSError, RequestTimeoutError, ValueError) as exc:
+        send_error(
+            view.page,
+            _("Download failed: ({exc_class_name}) {str_err}").format(
+                exc_class_name=exc.__class__.__name__, str_err=str(exc)
+            ),
+        )
     finally:
+        if not completed:
+            discard_download(task_id)
         view.page.overlay.remove(progress_column)
         view.page.update()
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+from typing import Any, Optional
+from include.constants import FLET_APP_STORAGE_DATA
+
+__all__ = ["CACHE_PATH", "DEFAULT_CACHE_BUDGET", "DocumentCache", "document_cache"]
+
+CACHE_PATH = FLET_APP_STORAGE_DATA + "/cache"
+DEFAULT_CACHE_BUDGET = 512 * 1024**2
+# Changes to the index are written out at most this often, in seconds.
+SAVE_DELAY = 1.0
+
+
+def _key(server_address: str, document_id: str) -> str:
+    # Document IDs are only unique on their server
+    return f"{server_address}#{document_id}"
+
+
+class DocumentCache(object):
+    """
+    Keeps copies of downloaded documents, so that opening a document again
+    does not transfer it again while it is unchanged on the server.
+
+    File contents are stored once per SHA-256 in ``blobs/``. The index maps
+    each document, by server address and document ID, to the hash and
+    ``last_modified`` time it had when it was downloaded; an entry is only
+    used while ``last_modified`` still matches. The blobs are kept within
+    ``budget`` bytes by evicting the documents used least recently. Hits,
+    misses and the bytes they saved are counted in the index as well.
+
+    Changes to the index are collected for ``SAVE_DELAY`` seconds and then
+    written out on a worker thread.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, budget: int = DEFAULT_CACHE_BUDGET) -> None:
+        self.path = path
+        self.budget = budget
+        self._index: Optional[dict[str, Any]] = None
+        self._dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.path, "index.json")
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.path, "blobs", sha256)
+
+    @property
+    def index(self) -> dict[str, Any]:
+        if self._index is None:
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+            self._index.setdefault("documents", {})
+            self._index.setdefault(
+                "stats", {"hits": 0, "misses": 0, "bytes_saved": 0}
+            )
+        return self._index
+
+    def _write(self, data: str) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(temp_path, self.index_path)
+
+    def _save(self) -> None:
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._dirty = False
+            self._write(json.dumps(self.index))
+            return
+        if self._save_task is None or self._save_task.done():
+            self._save_task = loop.create_task(self._save_later())
+
+    async def _save_later(self) -> None:
+        while self._dirty:
+            await asyncio.sleep(SAVE_DELAY)
+            self._dirty = False
+            try:
+                await asyncio.to_thread(self._write, json.dumps(self.index))
+            except OSError:
+                # Caching is best effort, the next change tries again
+                pass
+
+    @property
+    def size(self) -> int:
+        """The bytes taken up by cached files."""
+        blobs = {entry["sha256"]: entry["size"] for entry in self.index["documents"].values()}
+        return sum(blobs.values())
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        stats = dict(self.index["stats"])
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["size"] = self.size
+        return stats
+
+    def holds(self, server_address: str, document_id: str) -> bool:
+        """Whether some version of the document is cached."""
+        return _key(server_address, document_id) in self.index["documents"]
+
+    def lookup(
+        self, server_address: str, document_id: str, last_modified: float
+    ) -> Optional[str]:
+        """Returns the path of the cached copy of the document, if it is current."""
+        entry = self.index["documents"].get(_key(server_address, document_id))
+        if entry is None or entry["last_modified"] != last_modified:
+            return None
+
+        blob_path = self._blob_path(entry["sha256"])
+        try:
+            if os.path.getsize(blob_path) == entry["size"]:
+                return blob_path
+        except OSError:
+            pass
+        # The cached file was removed or damaged
+        self.invalidate(server_address, document_id)
+        return None
+
+    async def restore(
+        self,
+        server_address: str,
+        document_id: str,
+        last_modified: float,
+        file_path: str,
+    ) -> bool:
+        """
+        Copies the cached document to ``file_path`` if the cache holds its
+        current version, and counts the lookup as a hit or a miss.
+        """
+        stats = self.index["stats"]
+        if (
+            blob_path := self.lookup(server_address, document_id, last_modified)
+        ) is None:
+            stats["misses"] += 1
+            self._save()
+            return False
+
+        await asyncio.to_thread(shutil.copyfile, blob_path, file_path)
+
+        entry = self.index["documents"][_key(server_address, document_id)]
+        entry["last_used"] = time.time()
+        stats["hits"] += 1
+        stats["bytes_saved"] += entry["size"]
+        self._save()
+        return True
+
+    async def store(
+        self,
+        server_address: str,
+        document_id: str,
+        last_modified: float,
+        sha256: str,
+        file_path: str,
+    ) -> None:
+        """Adds a downloaded document, evicting others to stay within the budget."""
+        size = os.path.getsize(file_path)
+        if size > self.budget:
+            self.invalidate(server_address, document_id)
+            return
+
+        blob_path = self._blob_path(sha256)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            temp_path = blob_path + ".tmp"
+            await asyncio.to_thread(shutil.copyfile, file_path, temp_path)
+            os.replace(temp_path, blob_path)
+
+        self.index["documents"][_key(server_address, document_id)] = {
+            "sha256": sha256,
+            "last_modified": last_modified,
+            "size": size,
+            "last_used": time.time(),
+        }
+        self._evict()
+        self._save()
+
+    def _remove(self, key: str) -> None:
+        entry = self.index["documents"].pop(key, None)
+        if entry is None:
+            return
+        # Other documents may have the same contents
+        if not any(
+            other["sha256"] == entry["sha256"]
+            for other in self.index["documents"].values()
+        ):
+            try:
+                os.remove(self._blob_path(entry["sha256"]))
+            except OSError:
+                pass
+
+    def _evict(self) -> None:
+        documents = self.index["documents"]
+        for key in sorted(documents, key=lambda d: documents[d]["last_used"]):
+            if self.size <= self.budget:
+                break
+            self._remove(key)
+
+    def invalidate(self, server_address: str, document_id: str) -> None:
+        if (key := _key(server_address, document_id)) in self.index["documents"]:
+            self._remove(key)
+            self._save()
+
+    def resize(self, budget: int) -> None:
+        self.budget = budget
+        self._evict()
+        self._save()
+
+    def clear(self) -> None:
+        """Removes all cached files. The statistics are kept."""
+        self.index["documents"].clear()
+        shutil.rmtree(os.path.join(self.path, "blobs"), ignore_errors=True)
+        self._save()
+
+
+document_cache = DocumentCache()
@@ -0,0 +1,118 @@
+import json
+import types
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+
+__all__ = [
+    "Codec",
+    "JSONCodec",
+    "MessagePackCodec",
+    "CBORCodec",
+    "get_available_codecs",
+    "get_supported_encodings",
+    "negotiate_codec",
+]
+
+
+class Codec(ABC):
+    """
+    Serializes control messages for the wire.
+
+    ``binary`` tells whether encoded messages are sent as binary frames.
+    Text frames are always decoded as JSON, so a connection can switch codecs
+    without losing responses that were already on their way.
+    """
+
+    name: str = ""
+    binary: bool = False
+
+    @abstractmethod
+    def encode(self, message: dict[str, Any]) -> str | bytes: ...
+
+    @abstractmethod
+    def decode(self, data: str | bytes) -> dict[str, Any]: ...
+
+
+class JSONCodec(Codec):
+    name = "json"
+
+    def encode(self, message: dict[str, Any]) -> str:
+        return json.dumps(message, ensure_ascii=False)
+
+    def decode(self, data: str | bytes) -> dict[str, Any]:
+        return json.loads(data)
+
+
+class MessagePackCodec(Codec):
+    name = "msgpack"
+    binary = True
+
+    def __init__(self) -> None:
+        import msgpack
+        from msgpack import fallback
+
+        # The pure-Python fallback is several times slower than JSON
+        if msgpack.Packer is fallback.Packer:
+            raise ImportError("msgpack is installed without its C extension")
+
+        self._packb = msgpack.packb
+        self._unpackb = msgpack.unpackb
+
+    def encode(self, message: dict[str, Any]) -> bytes:
+        return self._packb(message, use_bin_type=True)
+
+    def decode(self, data: str | bytes) -> dict[str, Any]:
+        return self._unpackb(data, raw=False)
+
+
+class CBORCodec(Codec):
+    name = "cbor"
+    binary = True
+
+    def __init__(self) -> None:
+        import cbor2
+
+        # cbor2 falls back to a pure-Python implementation without _cbor2
+        if not isinstance(cbor2.dumps, types.BuiltinFunctionType):
+            raise ImportError("cbor2 is installed without its C extension")
+
+        self._dumps = cbor2.dumps
+        self._loads = cbor2.loads
+
+    def encode(self, message: dict[str, Any]) -> bytes:
+        return self._dumps(message)
+
+    def decode(self, data: str | bytes) -> dict[str, Any]:
+        return self._loads(data)
+
+
+# In order of preference. Binary codecs are optional dependencies, and are
+# only offered when their C extension is loaded.
+_CODEC_CLASSES: list[type[Codec]] = [MessagePackCodec, CBORCodec, JSONCodec]
+
+
+def get_available_codecs() -> list[Codec]:
+    codecs = []
+    for codec_class in _CODEC_CLASSES:
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            continue
+    return codecs
+
+
+def get_supported_encodings() -> list[str]:
+    return [codec.name for codec in get_available_codecs()]
+
+
+def negotiate_codec(server_info: dict[str, Any]) -> Codec:
+    """
+    Picks the most preferred codec that the server also lists in the
+    ``encodings`` field of its ``server_info`` data, falling back to JSON.
+    """
+    server_encodings: Optional[list[str]] = server_info.get("encodings")
+    if server_encodings:
+        for codec in get_available_codecs():
+            if codec.name in server_encodings:
+                return codec
+    return JSONCodec()
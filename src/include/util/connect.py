@@ -1,17 +1,58 @@
 import ssl
+import time
+import asyncio
 from typing import Literal
 from websockets.asyncio.client import connect
+from websockets.protocol import State
 from include.classes.client import LockableClientConnection
 from include.constants import INTEGRATED_CA_CERT
 
 
-async def get_connection(
-    server_address,
-    disable_ssl_enforcement: bool = False,
-    max_size: int = 2**20,
-    proxy: str | Literal[True] | None = True,
-) -> LockableClientConnection:
-    ssl_context = ssl.create_default_context()
+class ResumableSSLContext(ssl.SSLContext):
+    """
+    An SSLContext that offers the last TLS session seen for a host whenever a
+    new connection to that host is wrapped, so that reconnects and transfer
+    sockets can use an abbreviated handshake.
+    """
+
+    def __init__(self, protocol: int = ssl.PROTOCOL_TLS_CLIENT) -> None:
+        self.sessions: dict[str | None, ssl.SSLSession] = {}
+
+    def wrap_bio(
+        self,
+        incoming,
+        outgoing,
+        server_side=False,
+        server_hostname=None,
+        session=None,
+    ):
+        if session is None and not server_side:
+            session = self.sessions.get(server_hostname)
+        return super().wrap_bio(
+            incoming,
+            outgoing,
+            server_side=server_side,
+            server_hostname=server_hostname,
+            session=session,
+        )
+
+    def remember_session(self, ssl_object: ssl.SSLObject | None) -> None:
+        if ssl_object is not None and ssl_object.session is not None:
+            self.sessions[ssl_object.server_hostname] = ssl_object.session
+
+
+_ssl_contexts: dict[tuple[str, bool], ResumableSSLContext] = {}
+
+
+def get_ssl_context(
+    server_address: str, disable_ssl_enforcement: bool = False
+) -> ResumableSSLContext:
+    key = (server_address, disable_ssl_enforcement)
+    if (ssl_context := _ssl_contexts.get(key)) is not None:
+        return ssl_context
+
+    ssl_context = ResumableSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ssl_context.load_default_certs(ssl.Purpose.SERVER_AUTH)
     if not disable_ssl_enforcement:
         ssl_context.load_verify_locations(cadata=INTEGRATED_CA_CERT)
         ssl_context.check_hostname = True
@@ -20,6 +61,139 @@ async def get_connection(
         ssl_context.check_hostname = False
         ssl_context.verify_mode = ssl.CERT_NONE
 
-    return LockableClientConnection(
-        await connect(server_address, ssl=ssl_context, max_size=max_size, proxy=proxy)
+    _ssl_contexts[key] = ssl_context
+    return ssl_context
+
+
+async def get_connection(
+    server_address,
+    disable_ssl_enforcement: bool = False,
+    max_size: int = 2**20,
+    proxy: str | Literal[True] | None = True,
+) -> LockableClientConnection:
+    ssl_context = get_ssl_context(server_address, disable_ssl_enforcement)
+
+    connection = await connect(
+        server_address, ssl=ssl_context, max_size=max_size, proxy=proxy
     )
+    # Session tickets arrive after the handshake, so pick them up once the
+    # websocket upgrade has completed.
+    ssl_context.remember_session(connection.transport.get_extra_info("ssl_object"))
+
+    return LockableClientConnection(connection)
+
+
+async def close_connection(conn: LockableClientConnection) -> None:
+    try:
+        # conn.close() times out on the wrapper, close the underlying one instead
+        await conn._wrapped_connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool(object):
+    """
+    A bounded pool of transfer connections.
+
+    Connections are keyed by server address and connection options. At most
+    ``max_connections_per_server`` connections to one server can be borrowed
+    at the same time; further callers wait for one to be released. Released
+    connections are kept for ``idle_timeout`` seconds and are checked to be
+    still open before they are handed out again.
+
+    A connection whose transfer did not run to completion must be released
+    with ``discard=True``, as the server may still be expecting data on it.
+    """
+
+    def __init__(
+        self, max_connections_per_server: int = 4, idle_timeout: float = 60.0
+    ) -> None:
+        self.max_connections_per_server = max_connections_per_server
+        self.idle_timeout = idle_timeout
+        self._idle: dict[tuple, list[tuple[float, LockableClientConnection]]] = {}
+        self._limits: dict[str, asyncio.Semaphore] = {}
+        self._borrowed: dict[int, tuple] = {}
+
+    def _get_limit(self, server_address: str) -> asyncio.Semaphore:
+        if server_address not in self._limits:
+            self._limits[server_address] = asyncio.Semaphore(
+                self.max_connections_per_server
+            )
+        return self._limits[server_address]
+
+    @staticmethod
+    def is_healthy(conn: LockableClientConnection) -> bool:
+        return conn.state is State.OPEN
+
+    async def _prune(self) -> None:
+        now = time.monotonic()
+        stale = []
+        # Take stale connections out before closing any, as other tasks may
+        # acquire, release or prune while this one waits for a close.
+        for key, idle in list(self._idle.items()):
+            keep = []
+            for released_at, conn in idle:
+                if now - released_at <= self.idle_timeout and self.is_healthy(conn):
+                    keep.append((released_at, conn))
+                else:
+                    stale.append(conn)
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+
+        for conn in stale:
+            await close_connection(conn)
+
+    async def acquire(
+        self,
+        server_address: str,
+        disable_ssl_enforcement: bool = False,
+        max_size: int = 2**20,
+        proxy: str | Literal[True] | None = True,
+    ) -> LockableClientConnection:
+        key = (server_address, disable_ssl_enforcement, max_size, proxy)
+        limit = self._get_limit(server_address)
+
+        await limit.acquire()
+        try:
+            await self._prune()
+            if idle := self._idle.get(key):
+                _, conn = idle.pop()
+            else:
+                conn = await get_connection(
+                    server_address, disable_ssl_enforcement, max_size, proxy
+                )
+        except BaseException:
+            limit.release()
+            raise
+
+        self._borrowed[id(conn)] = key
+        return conn
+
+    async def release(
+        self, conn: LockableClientConnection, discard: bool = False
+    ) -> None:
+        key = self._borrowed.pop(id(conn))
+        self._get_limit(key[0]).release()
+
+        idle = self._idle.setdefault(key, [])
+        if (
+            discard
+            or not self.is_healthy(conn)
+            or len(idle) >= self.max_connections_per_server
+        ):
+            await close_connection(conn)
+        else:
+            idle.append((time.monotonic(), conn))
+
+        await self._prune()
+
+    async def close_all(self) -> None:
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for _, conn in connections:
+                await close_connection(conn)
+
+
+transfer_pool = ConnectionPool()
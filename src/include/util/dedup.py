@@ -0,0 +1,46 @@
+from collections import OrderedDict
+from typing import Optional
+
+__all__ = ["RecentUploads", "recent_uploads"]
+
+# Hashes remembered by the session index before the oldest are forgotten.
+RECENT_UPLOADS_SIZE = 4096
+
+
+class RecentUploads(object):
+    """
+    The contents the server is known to hold in this session, by SHA-256 and
+    size: files uploaded, or found to be on the server already.
+
+    With the server's ``deduplicated_upload`` feature, a document whose
+    content is in here is created from the stored content straight away,
+    without asking first on a transfer connection. The index is cleared when
+    a new session starts, as it only holds for one server.
+    """
+
+    def __init__(self, max_size: int = RECENT_UPLOADS_SIZE) -> None:
+        self.max_size = max_size
+        self._hashes: OrderedDict[tuple[str, int], None] = OrderedDict()
+
+    def add(self, sha256: Optional[str], size: int) -> None:
+        if not sha256:
+            return
+        self._hashes[(sha256, size)] = None
+        self._hashes.move_to_end((sha256, size))
+        while len(self._hashes) > self.max_size:
+            self._hashes.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, content: tuple[Optional[str], int]) -> bool:
+        return content in self._hashes
+
+    def discard(self, sha256: Optional[str], size: int) -> None:
+        self._hashes.pop((sha256, size), None)
+
+    def clear(self) -> None:
+        self._hashes.clear()
+
+
+recent_uploads = RecentUploads()
@@ -0,0 +1,66 @@
+import struct
+from typing import NamedTuple, Optional
+
+__all__ = [
+    "CHUNK_ENCODINGS",
+    "ChunkFrame",
+    "encode_chunk_frame",
+    "decode_chunk_frame",
+]
+
+# Chunk encodings the client accepts for downloads, in order of preference.
+CHUNK_ENCODINGS = ["binary", "json"]
+
+# index, payload length, flags
+_HEADER = struct.Struct("!IIB")
+_FLAG_HASH = 0x01
+_FLAG_IV = 0x02
+_HASH_SIZE = 32
+_IV_SIZE = 16
+
+
+class ChunkFrame(NamedTuple):
+    index: int
+    data: memoryview
+    hash: Optional[str]
+    iv: Optional[bytes]
+
+
+def encode_chunk_frame(
+    index: int, data: bytes, hash: Optional[str] = None, iv: Optional[bytes] = None
+) -> bytes:
+    """
+    Builds a binary chunk frame: a fixed header of index, payload length and
+    flags, the raw SHA-256 digest and IV if the flags say so, then the payload.
+    """
+    flags = (_FLAG_HASH if hash else 0) | (_FLAG_IV if iv else 0)
+    return b"".join(
+        (
+            _HEADER.pack(index, len(data), flags),
+            bytes.fromhex(hash) if hash else b"",
+            iv or b"",
+            data,
+        )
+    )
+
+
+def decode_chunk_frame(frame: bytes) -> ChunkFrame:
+    view = memoryview(frame)
+    index, length, flags = _HEADER.unpack_from(view)
+    offset = _HEADER.size
+
+    hash = None
+    if flags & _FLAG_HASH:
+        hash = view[offset : offset + _HASH_SIZE].hex()
+        offset += _HASH_SIZE
+
+    iv = None
+    if flags & _FLAG_IV:
+        iv = bytes(view[offset : offset + _IV_SIZE])
+        offset += _IV_SIZE
+
+    if len(view) - offset != length:
+        raise ValueError(
+            f"Chunk {index} declares {length} bytes but carries {len(view) - offset}"
+        )
+    return ChunkFrame(index, view[offset:], hash, iv)
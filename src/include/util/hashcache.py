@@ -0,0 +1,125 @@
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from include.constants import FLET_APP_STORAGE_DATA
+
+__all__ = ["HASH_CACHE_PATH", "FileHashCache", "file_hash_cache"]
+
+HASH_CACHE_PATH = FLET_APP_STORAGE_DATA + "/file_hashes.db"
+# Entries kept before the least recently used ones are dropped.
+HASH_CACHE_ENTRIES = 50000
+# Access times of cache hits are written out in batches of this many, or
+# with the next stored hash.
+TOUCH_BATCH_SIZE = 256
+
+
+def _stat_key(stat: os.stat_result) -> tuple[int, int, int]:
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+class FileHashCache(object):
+    """
+    Remembers the SHA-256 of local files, so that uploading a file again
+    does not hash it again.
+
+    Entries are keyed by absolute path and only used while the file's size,
+    modification time and inode are unchanged. The cache is an SQLite
+    database, which is opened on first use. All database access runs on a
+    thread of its own, so the event loop never waits on the disk, and a
+    lookup only reads: the access times of hits are kept in memory and
+    committed later in batches.
+    """
+
+    def __init__(
+        self, path: str = HASH_CACHE_PATH, max_entries: int = HASH_CACHE_ENTRIES
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self._db: Optional[sqlite3.Connection] = None
+        self._touched: dict[str, float] = {}
+        self._thread = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="hashcache"
+        )
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS file_hashes ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                "inode INTEGER, sha256 TEXT, last_used REAL)"
+            )
+            self._db.commit()
+        return self._db
+
+    async def lookup(self, file_path: str, stat: os.stat_result) -> Optional[str]:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._thread, self._lookup, file_path, stat
+        )
+
+    async def store(self, file_path: str, stat: os.stat_result, sha256: str) -> None:
+        """
+        Saves the hash of the file as it was when ``stat`` was taken. Nothing
+        is saved if the file has changed since, e.g. while it was hashed.
+        """
+        await asyncio.get_running_loop().run_in_executor(
+            self._thread, self._store, file_path, stat, sha256
+        )
+
+    def _lookup(self, file_path: str, stat: os.stat_result) -> Optional[str]:
+        file_path = os.path.abspath(file_path)
+        row = self.db.execute(
+            "SELECT size, mtime_ns, inode, sha256 FROM file_hashes WHERE path = ?",
+            (file_path,),
+        ).fetchone()
+        if row is None or tuple(row[:3]) != _stat_key(stat):
+            return None
+
+        self._touched[file_path] = time.time()
+        if len(self._touched) >= TOUCH_BATCH_SIZE:
+            self._flush_touched()
+            self.db.commit()
+        return row[3]
+
+    def _flush_touched(self) -> None:
+        self.db.executemany(
+            "UPDATE file_hashes SET last_used = ? WHERE path = ?",
+            [(last_used, path) for path, last_used in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def _store(self, file_path: str, stat: os.stat_result, sha256: str) -> None:
+        if _stat_key(os.stat(file_path)) != _stat_key(stat):
+            return
+
+        self._touched.pop(os.path.abspath(file_path), None)
+        self._flush_touched()
+        self.db.execute(
+            "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?, ?)",
+            (os.path.abspath(file_path), *_stat_key(stat), sha256, time.time()),
+        )
+        self.db.execute(
+            "DELETE FROM file_hashes WHERE path IN (SELECT path FROM file_hashes "
+            "ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self.db.commit()
+
+    def close(self) -> None:
+        self._thread.submit(self._close).result()
+
+    def _close(self) -> None:
+        if self._db is not None:
+            if self._touched:
+                self._flush_touched()
+                self._db.commit()
+            self._db.close()
+            self._db = None
+
+
+file_hash_cache = FileHashCache()
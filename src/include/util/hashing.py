@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+from typing import Optional
+from include.classes.exceptions.transmission import (
+    FileHashMismatchError,
+    FileSizeMismatchError,
+)
+from include.util.workers import crypto_executor
+
+__all__ = ["StreamHasher", "ChunkVerifier"]
+
+# Chunks are hashed in batches of this many, to keep the per-job overhead of
+# the worker threads small next to 8 KiB chunks.
+CHUNK_VERIFY_BATCH = 64
+# Batches that may be waiting for a worker before the download is held up.
+CHUNK_VERIFY_BACKLOG = 16
+
+
+class StreamHasher(object):
+    """
+    Hashes data incrementally while it is being written, so that a finished
+    file can be verified without reading it back.
+    """
+
+    def __init__(self, algorithm: str = "sha256") -> None:
+        self._hash = hashlib.new(algorithm)
+        self.size = 0
+
+    def update(self, data: bytes | bytearray | memoryview) -> None:
+        self._hash.update(data)
+        self.size += len(data)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    def verify(
+        self, expected_digest: Optional[str], expected_size: Optional[int] = None
+    ) -> None:
+        if expected_size is not None and self.size != expected_size:
+            raise FileSizeMismatchError(expected_size, self.size)
+
+        if expected_digest and (actual_digest := self.hexdigest()) != expected_digest:
+            raise FileHashMismatchError(expected_digest, actual_digest)
+
+
+def _find_corrupt_chunks(
+    batch: list[tuple[int, bytes | memoryview, str]],
+) -> list[int]:
+    return [
+        index
+        for index, data, expected_hash in batch
+        if hashlib.sha256(data).hexdigest() != expected_hash
+    ]
+
+
+class ChunkVerifier(object):
+    """
+    Checks the SHA-256 hashes that the server sends with download chunks.
+
+    Chunks are hashed in batches on the crypto worker threads while the
+    download goes on. The index of a chunk that passes is added to
+    ``verified``, e.g. a manifest's received chunks, once its batch has been
+    checked; until then it counts as ``pending``. ``corrupt`` returns the
+    indexes of chunks that failed the check in the batches finished so far,
+    and ``drain`` waits for the rest. Chunks sent without a hash cannot be
+    checked and are added to ``verified`` at once. ``cancel`` drops the
+    pending chunks without recording them.
+    """
+
+    def __init__(self, verified: set[int]) -> None:
+        self.verified = verified
+        self._batch: list[tuple[int, bytes | memoryview, str]] = []
+        self._jobs: list[tuple[list[int], asyncio.Future[list[int]]]] = []
+
+    @property
+    def pending(self) -> int:
+        """The number of chunks waiting for their check."""
+        return len(self._batch) + sum(len(indexes) for indexes, _ in self._jobs)
+
+    def _submit(self) -> None:
+        if self._batch:
+            self._jobs.append(
+                (
+                    [index for index, _, _ in self._batch],
+                    asyncio.ensure_future(
+                        crypto_executor.run(_find_corrupt_chunks, self._batch)
+                    ),
+                )
+            )
+            self._batch = []
+
+    async def add(
+        self, index: int, data: bytes | memoryview, expected_hash: Optional[str]
+    ) -> None:
+        if not expected_hash:
+            self.verified.add(index)
+            return
+
+        self._batch.append((index, data, expected_hash))
+        if len(self._batch) >= CHUNK_VERIFY_BATCH:
+            self._submit()
+            if len(self._jobs) > CHUNK_VERIFY_BACKLOG:
+                await asyncio.wait([self._jobs[0][1]])
+
+    def corrupt(self) -> list[int]:
+        corrupt: list[int] = []
+        while self._jobs and self._jobs[0][1].done():
+            indexes, job = self._jobs.pop(0)
+            failed = job.result()
+            self.verified.update(index for index in indexes if index not in failed)
+            corrupt += failed
+        return corrupt
+
+    async def drain(self) -> list[int]:
+        self._submit()
+        if self._jobs:
+            await asyncio.wait([job for _, job in self._jobs])
+        return self.corrupt()
+
+    def cancel(self) -> None:
+        for _, job in self._jobs:
+            job.cancel()
+        self._jobs.clear()
+        self._batch.clear()
@@ -0,0 +1,127 @@
+import time
+import threading
+from collections import deque
+from typing import Any
+
+__all__ = ["ActionMetrics", "ProtocolMetrics", "metrics"]
+
+# Number of latency samples kept per action for the percentiles.
+LATENCY_WINDOW = 1024
+
+
+def _percentile(sorted_samples: list[float], percent: float) -> float | None:
+    if not sorted_samples:
+        return None
+    index = round(percent / 100 * (len(sorted_samples) - 1))
+    return sorted_samples[index]
+
+
+class ActionMetrics(object):
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.encode_time = 0.0
+        self.decode_time = 0.0
+        self.transfer_time = 0.0
+
+    def snapshot(self) -> dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "latency_ms": {
+                name: (value * 1000 if value is not None else None)
+                for name, value in (
+                    ("p50", _percentile(latencies, 50)),
+                    ("p95", _percentile(latencies, 95)),
+                    ("p99", _percentile(latencies, 99)),
+                )
+            },
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "encode_ms": self.encode_time * 1000,
+            "decode_ms": self.decode_time * 1000,
+            "throughput_mbps": (
+                (self.bytes_out + self.bytes_in) / self.transfer_time / 1024**2
+                if self.transfer_time
+                else None
+            ),
+        }
+
+
+class ProtocolMetrics(object):
+    """
+    Per-action counters, latency percentiles and byte counts for the client
+    protocol. Control requests are recorded by the request dispatcher and
+    ``do_request``; file transfers by the helpers in ``include.util.transfer``.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._actions: dict[str, ActionMetrics] = {}
+        self.started_at = time.time()
+
+    def _get(self, action: str) -> ActionMetrics:
+        if action not in self._actions:
+            self._actions[action] = ActionMetrics()
+        return self._actions[action]
+
+    def record_request(self, action: str, latency: float, failed: bool = False) -> None:
+        with self._lock:
+            entry = self._get(action)
+            entry.count += 1
+            entry.latencies.append(latency)
+            if failed:
+                entry.errors += 1
+
+    def record_encode(self, action: str, seconds: float, size: int) -> None:
+        with self._lock:
+            entry = self._get(action)
+            entry.encode_time += seconds
+            entry.bytes_out += size
+
+    def record_decode(self, action: str, seconds: float, size: int) -> None:
+        with self._lock:
+            entry = self._get(action)
+            entry.decode_time += seconds
+            entry.bytes_in += size
+
+    def record_transfer(
+        self,
+        action: str,
+        seconds: float,
+        bytes_out: int = 0,
+        bytes_in: int = 0,
+        failed: bool = False,
+    ) -> None:
+        with self._lock:
+            entry = self._get(action)
+            entry.count += 1
+            entry.latencies.append(seconds)
+            entry.transfer_time += seconds
+            entry.bytes_out += bytes_out
+            entry.bytes_in += bytes_in
+            if failed:
+                entry.errors += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "taken_at": time.time(),
+                "actions": {
+                    action: entry.snapshot()
+                    for action, entry in sorted(self._actions.items())
+                },
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._actions.clear()
+            self.started_at = time.time()
+
+
+metrics = ProtocolMetrics()
@@ -1,11 +1,52 @@
 import json, time, ssl
 import flet as ft
 from include.classes.client import LockableClientConnection
+from include.classes.exceptions.request import ConnectionLostError, RequestTimeoutError
+from include.util.metrics import metrics
 from include.ui.util.notifications import send_error
 import threading, asyncio
+from typing import Literal
 
 # from include.function.lockdown import go_lockdown
 
+# Default deadlines in seconds for each class of action. A request may
+# override them with its own ``timeout``; None waits indefinitely.
+DEFAULT_TIMEOUTS: dict[str, float | None] = {
+    "listing": 30.0,
+    "admin": 60.0,
+    "transfer": 20.0,
+    "default": 30.0,
+}
+
+ACTION_CLASSES: dict[str, str] = {
+    "server_info": "listing",
+    "list_directory": "listing",
+    "get_directory_info": "listing",
+    "get_document_info": "listing",
+    "list_users": "listing",
+    "get_user_info": "listing",
+    "list_groups": "listing",
+    "get_group_info": "listing",
+    "view_audit_logs": "listing",
+    "create_user": "admin",
+    "delete_user": "admin",
+    "rename_user": "admin",
+    "change_user_groups": "admin",
+    "create_group": "admin",
+    "delete_group": "admin",
+    "rename_group": "admin",
+    "change_group_permissions": "admin",
+    "create_document": "transfer",
+    "get_document": "transfer",
+    "upload_file": "transfer",
+    "download_file": "transfer",
+}
+
+
+def get_default_timeout(action: str) -> float | None:
+    return DEFAULT_TIMEOUTS[ACTION_CLASSES.get(action, "default")]
+
+
 async def do_request(
     conn: LockableClientConnection,
     action: str,
@@ -13,7 +54,22 @@ async def do_request(
     message: str = "",
     username=None,
     token=None,
+    timeout: float | None | Literal["default"] = "default",
+    raise_on_timeout: bool = False,
 ) -> dict:
+    """
+    Sends a request and waits for its response.
+
+    ``timeout`` defaults to the deadline of the action's class in
+    ``DEFAULT_TIMEOUTS``; pass ``timeout=None`` to wait indefinitely. A
+    request that runs past its deadline returns a failed response with code
+    408, which callers report like any other failure. Pass
+    ``raise_on_timeout=True`` to get ``RequestTimeoutError`` instead. A
+    request lost with the connection returns a failed response with code 503.
+    """
+
+    if timeout == "default":
+        timeout = get_default_timeout(action)
 
     request = {
         "action": action,
@@ -23,11 +79,90 @@ async def do_request(
         "timestamp": time.time(),
     }
 
-    request_json = json.dumps(request, ensure_ascii=False)
+    started = time.perf_counter()
+    failed = True
+    try:
+        # Responses are correlated by the connection's dispatcher, so the lock
+        # is only held while the request frame is being written.
+        try:
+            response = await conn.dispatcher.request(request, timeout)
+        except RequestTimeoutError as exc:
+            if raise_on_timeout or exc.response is None:
+                raise
+            response = exc.response
+        except ConnectionLostError as exc:
+            assert exc.response is not None
+            response = exc.response
+        failed = response.get("code") != 200
+        return response
+    finally:
+        metrics.record_request(action, time.perf_counter() - started, failed)
+
+
+async def do_batch_request(
+    conn: LockableClientConnection,
+    requests: list[dict],
+    username=None,
+    token=None,
+    timeout: float | None | Literal["default"] = "default",
+    raise_on_timeout: bool = False,
+) -> list[dict]:
+    """
+    Sends several actions and returns their responses in the same order.
+
+    Each item of ``requests`` is a dict with an ``action`` and optional
+    ``data``. Every response carries its own ``code``, so one failing item
+    does not affect the others. Servers that announce the ``batch`` feature
+    receive all items in a single frame; otherwise the items are sent as
+    individual requests that are pipelined over the connection.
+
+    Unless ``timeout`` is given, a single batch frame gets the longest
+    default deadline among its actions. Timeouts are handled as in
+    ``do_request``.
+    """
+
+    if not requests:
+        return []
 
-    async with conn.lock:
-        await conn.send(request_json)
-        response = await conn.recv()
+    if conn.dispatcher.supports_batch:
+        response = await do_request(
+            conn,
+            "batch",
+            {
+                "requests": [
+                    {"action": item["action"], "data": item.get("data", {})}
+                    for item in requests
+                ]
+            },
+            username=username,
+            token=token,
+            timeout=(
+                max(
+                    (get_default_timeout(item["action"]) for item in requests),
+                    key=lambda value: float("inf") if value is None else value,
+                )
+                if timeout == "default"
+                else timeout
+            ),
+            raise_on_timeout=raise_on_timeout,
+        )
+        if response["code"] != 200:
+            return [response] * len(requests)
+        return response["data"]["results"]
 
-    loaded_response: dict = json.loads(response)
-    return loaded_response
\ No newline at end of file
+    return list(
+        await asyncio.gather(
+            *(
+                do_request(
+                    conn,
+                    item["action"],
+                    item.get("data", {}),
+                    username=username,
+                    token=token,
+                    timeout=timeout,
+                    raise_on_timeout=raise_on_timeout,
+                )
+                for item in requests
+            )
+        )
+    )
@@ -0,0 +1,266 @@
+import json
+import os
+import time
+from typing import Any, Optional
+from include.constants import FLET_APP_STORAGE_DATA, FLET_APP_STORAGE_TEMP
+
+__all__ = [
+    "DOWNLOADING_PATH",
+    "DownloadManifest",
+    "get_spool_path",
+    "discard_download",
+    "UPLOADING_PATH",
+    "UploadState",
+]
+
+DOWNLOADING_PATH = FLET_APP_STORAGE_TEMP + "/downloading"
+# Kept with the app data, as unfinished uploads must survive restarts
+UPLOADING_PATH = FLET_APP_STORAGE_DATA + "/uploading"
+
+
+def get_spool_path(task_id: str) -> str:
+    return os.path.join(DOWNLOADING_PATH, task_id + ".part")
+
+
+def discard_download(task_id: str) -> None:
+    """Removes the spool file and manifest left behind by a download task."""
+    for path in (
+        get_spool_path(task_id),
+        os.path.join(DOWNLOADING_PATH, task_id + ".json"),
+    ):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class DownloadManifest(object):
+    """
+    Records which chunks of a download have been written to its spool file,
+    so that an interrupted download of the same task can be continued instead
+    of starting over.
+
+    The manifest is kept next to the spool as ``<task_id>.json``. Received
+    chunks are stored as ``[start, end)`` index ranges.
+    """
+
+    def __init__(
+        self,
+        task_id: str,
+        sha256: Optional[str],
+        file_size: int,
+        chunk_size: int,
+        total_chunks: int,
+        iv: bytes = b"",
+        received: Optional[set[int]] = None,
+    ) -> None:
+        self.task_id = task_id
+        self.sha256 = sha256
+        self.file_size = file_size
+        self.chunk_size = chunk_size
+        self.total_chunks = total_chunks
+        self.iv = iv
+        self.received: set[int] = received or set()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(DOWNLOADING_PATH, self.task_id + ".json")
+
+    @property
+    def spool_path(self) -> str:
+        return get_spool_path(self.task_id)
+
+    @property
+    def complete(self) -> bool:
+        return len(self.received) >= self.total_chunks
+
+    @staticmethod
+    def _to_ranges(indexes: list[int]) -> list[list[int]]:
+        ranges: list[list[int]] = []
+        for index in indexes:
+            if ranges and ranges[-1][1] == index:
+                ranges[-1][1] = index + 1
+            else:
+                ranges.append([index, index + 1])
+        return ranges
+
+    def missing_ranges(self) -> list[list[int]]:
+        return self._to_ranges(
+            [i for i in range(self.total_chunks) if i not in self.received]
+        )
+
+    def matches(
+        self, sha256: Optional[str], file_size: int, chunk_size: int, total_chunks: int
+    ) -> bool:
+        return (self.sha256, self.file_size, self.chunk_size, self.total_chunks) == (
+            sha256,
+            file_size,
+            chunk_size,
+            total_chunks,
+        )
+
+    @classmethod
+    def load(cls, task_id: str) -> Optional["DownloadManifest"]:
+        """
+        Returns the manifest of an earlier attempt at the task, or None if
+        there is none or its spool file has gone missing.
+        """
+        manifest_path = os.path.join(DOWNLOADING_PATH, task_id + ".json")
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                data: dict[str, Any] = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not os.path.exists(get_spool_path(task_id)):
+            return None
+
+        return cls(
+            task_id,
+            data["sha256"],
+            data["file_size"],
+            data["chunk_size"],
+            data["total_chunks"],
+            iv=bytes.fromhex(data["iv"]),
+            received={
+                index for start, end in data["received"] for index in range(start, end)
+            },
+        )
+
+    def save(self) -> None:
+        os.makedirs(DOWNLOADING_PATH, exist_ok=True)
+        # Write to a temporary file first so a crash cannot leave a torn manifest
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "sha256": self.sha256,
+                    "file_size": self.file_size,
+                    "chunk_size": self.chunk_size,
+                    "total_chunks": self.total_chunks,
+                    "iv": self.iv.hex(),
+                    "received": self._to_ranges(sorted(self.received)),
+                },
+                f,
+            )
+        os.replace(temp_path, self.path)
+
+    def discard(self) -> None:
+        discard_download(self.task_id)
+
+
+class UploadState(object):
+    """
+    Records an unfinished upload task of a local file, so that the upload
+    can be continued on the same task after an interruption, also after the
+    app has been restarted.
+
+    The state is kept in ``UPLOADING_PATH`` as ``<task_id>.json``. It names
+    the file and where it is being uploaded to, the task's ``end_time``, and
+    the size, modification time and SHA-256 the file had when its bytes were
+    first sent. The server's committed offset is only used while all of these
+    still match.
+    """
+
+    def __init__(
+        self,
+        task_id: str,
+        file_path: str,
+        folder_id: Optional[str] = None,
+        title: Optional[str] = None,
+        end_time: Optional[float] = None,
+        file_size: Optional[int] = None,
+        mtime_ns: Optional[int] = None,
+        sha256: Optional[str] = None,
+    ) -> None:
+        self.task_id = task_id
+        self.file_path = os.path.abspath(file_path)
+        self.folder_id = folder_id
+        self.title = title
+        self.end_time = end_time
+        self.file_size = file_size
+        self.mtime_ns = mtime_ns
+        self.sha256 = sha256
+
+    @property
+    def path(self) -> str:
+        return os.path.join(UPLOADING_PATH, self.task_id + ".json")
+
+    @property
+    def expired(self) -> bool:
+        return self.end_time is not None and self.end_time <= time.time()
+
+    def matches(self, stat: os.stat_result, sha256: Optional[str]) -> bool:
+        """Whether the file is still the one whose bytes were sent before."""
+        return (self.file_size, self.mtime_ns, self.sha256) == (
+            stat.st_size,
+            stat.st_mtime_ns,
+            sha256,
+        )
+
+    def record_file(self, stat: os.stat_result, sha256: Optional[str]) -> None:
+        self.file_size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.sha256 = sha256
+
+    @classmethod
+    def load(cls, task_id: str) -> Optional["UploadState"]:
+        try:
+            with open(
+                os.path.join(UPLOADING_PATH, task_id + ".json"), "r", encoding="utf-8"
+            ) as f:
+                data: dict[str, Any] = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cls(task_id, **data)
+
+    @classmethod
+    def find(
+        cls, file_path: str, folder_id: Optional[str], title: Optional[str]
+    ) -> Optional["UploadState"]:
+        """
+        Returns the unfinished upload of the file to the same place, if its
+        task has not expired yet. States of expired tasks are removed.
+        """
+        try:
+            filenames = os.listdir(UPLOADING_PATH)
+        except OSError:
+            return None
+
+        file_path = os.path.abspath(file_path)
+        for filename in filenames:
+            if not filename.endswith(".json"):
+                continue
+            state = cls.load(filename[: -len(".json")])
+            if state is None:
+                continue
+            if state.expired:
+                state.discard()
+            elif (state.file_path, state.folder_id, state.title) == (
+                file_path,
+                folder_id,
+                title,
+            ):
+                return state
+        return None
+
+    def save(self) -> None:
+        os.makedirs(UPLOADING_PATH, exist_ok=True)
+        # Write to a temporary file first so a crash cannot leave a torn state
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "file_path": self.file_path,
+                    "folder_id": self.folder_id,
+                    "title": self.title,
+                    "end_time": self.end_time,
+                    "file_size": self.file_size,
+                    "mtime_ns": self.mtime_ns,
+                    "sha256": self.sha256,
+                },
+                f,
+            )
+        os.replace(temp_path, self.path)
+
+    def discard(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,115 @@
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+
+__all__ = ["Priority", "TokenBucket", "BandwidthShaper", "bandwidth"]
+
+# Longest a waiting transfer sleeps before it checks the bucket again, so
+# that a newly arrived transfer of higher priority is not held up for long.
+MAX_WAIT = 0.05
+
+# How long after its last chunk a transfer still holds back transfers of
+# lower priority when there is no rate limit.
+ACTIVE_FOR = 0.25
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # Control requests the UI is waiting for
+    FOREGROUND = 1  # Transfers the user started and is watching
+    BACKGROUND = 2  # Directory uploads and other bulk synchronisation
+
+
+class TokenBucket(object):
+    """
+    Limits the throughput of one direction of traffic to ``rate`` bytes per
+    second, allowing bursts of up to ``burst`` bytes. A rate of 0 means no
+    limit.
+
+    Transfers wait in ``acquire`` until enough tokens have accumulated. When
+    several are waiting, the one with the highest priority, and among those
+    the one that has waited longest, goes first. Interactive traffic never
+    waits: ``charge`` takes its tokens at once, even if that leaves the
+    bucket in debt, which the transfers then pay off.
+
+    Without a limit the link itself is the bottleneck, so a transfer waits
+    while one of higher priority has moved a chunk in the last ``ACTIVE_FOR``
+    seconds.
+    """
+
+    def __init__(self, rate: int = 0, burst: int | None = None) -> None:
+        self._waiters: list[tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._last_active: dict[Priority, float] = {}
+        self.configure(rate, burst)
+
+    def configure(self, rate: int, burst: int | None = None) -> None:
+        self.rate = max(0, rate)
+        # A quarter of a second of traffic, but enough for a large chunk
+        self.burst = burst or max(self.rate // 4, 256 * 1024)
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def charge(self, size: int) -> None:
+        if self.rate:
+            self._refill()
+            self.tokens -= size
+
+    def _outranked(self, priority: Priority) -> bool:
+        now = time.monotonic()
+        return any(
+            other < priority and now - active < ACTIVE_FOR
+            for other, active in self._last_active.items()
+        )
+
+    async def acquire(self, size: int, priority: Priority = Priority.FOREGROUND) -> None:
+        if priority is Priority.INTERACTIVE:
+            self.charge(size)
+            return
+        if not self.rate:
+            while self._outranked(priority):
+                await asyncio.sleep(MAX_WAIT)
+            self._last_active[priority] = time.monotonic()
+            return
+
+        # Chunks larger than the burst wait for a full bucket and go into debt
+        needed = min(size, self.burst)
+        ticket = (int(priority), next(self._sequence))
+        heapq.heappush(self._waiters, ticket)
+        try:
+            while True:
+                self._refill()
+                if self._waiters[0] == ticket and self.tokens >= needed:
+                    self.tokens -= size
+                    return
+                deficit = max(needed - self.tokens, 1)
+                await asyncio.sleep(min(deficit / self.rate, MAX_WAIT))
+        finally:
+            self._waiters.remove(ticket)
+            heapq.heapify(self._waiters)
+
+
+class BandwidthShaper(object):
+    """
+    The rate limits for traffic to and from the server, one token bucket per
+    direction. Limits are given in bytes per second, 0 for unlimited.
+    """
+
+    def __init__(self) -> None:
+        self.upload = TokenBucket()
+        self.download = TokenBucket()
+
+    def configure(self, upload_limit: int = 0, download_limit: int = 0) -> None:
+        self.upload.configure(upload_limit)
+        self.download.configure(download_limit)
+
+
+bandwidth = BandwidthShaper()
@@ -0,0 +1,146 @@
+import asyncio
+import gettext
+import random
+from typing import Any, Literal, Optional
+import flet as ft
+from include.classes.client import LockableClientConnection
+from include.classes.config import AppConfig
+from include.classes.exceptions.request import SessionExpiredError
+from include.constants import LOCALE_PATH
+from include.ui.util.notifications import send_error
+from include.util.codec import get_supported_encodings, negotiate_codec
+from include.util.connect import get_connection
+from include.util.requests import do_request
+
+t = gettext.translation("client", LOCALE_PATH, fallback=True)
+_ = t.gettext
+
+__all__ = ["ConnectionSupervisor", "negotiate_connection"]
+
+
+async def negotiate_connection(conn: LockableClientConnection) -> dict[str, Any]:
+    """
+    Requests ``server_info`` and applies the encoding and features announced
+    by the server to the connection's dispatcher.
+    """
+
+    server_info_response = await do_request(
+        conn,
+        "server_info",
+        {"encodings": get_supported_encodings()},
+        raise_on_timeout=True,
+    )
+    server_info: dict[str, Any] = server_info_response["data"]
+
+    conn.dispatcher.codec = negotiate_codec(server_info)
+    features = server_info.get("features", [])
+    conn.dispatcher.supports_batch = "batch" in features
+    conn.dispatcher.supports_ranged_download = "ranged_download" in features
+    conn.dispatcher.supports_resumable_upload = "resumable_upload" in features
+    conn.dispatcher.supports_deduplicated_upload = "deduplicated_upload" in features
+
+    return server_info_response
+
+
+class ConnectionSupervisor(object):
+    """
+    Replaces the main control connection after it drops.
+
+    ``reconnect`` is installed as the dispatcher's reconnect handler. It opens
+    a new connection with exponential backoff, renegotiates the protocol and
+    checks that the stored token is still accepted, so that the UI can carry
+    on with the same ``AppConfig.conn`` without going through ``/connect``
+    and ``/login`` again.
+
+    If the token is no longer accepted, the new connection is still handed to
+    the dispatcher and the user is sent to ``/login``. ``reconnect_failed`` is
+    installed as the dispatcher's failure handler and sends the user back to
+    ``/connect`` once every attempt has failed.
+    """
+
+    def __init__(
+        self,
+        page: ft.Page,
+        server_address: str,
+        disable_ssl_enforcement: bool = False,
+        proxy: str | Literal[True] | None = True,
+        max_attempts: int = 8,
+        initial_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ) -> None:
+        self.server_address = server_address
+        self.disable_ssl_enforcement = disable_ssl_enforcement
+        self.proxy = proxy
+        self.max_attempts = max_attempts
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.page = page
+        self.app_config = AppConfig()
+
+    async def restore_session(self, conn: LockableClientConnection) -> None:
+        await negotiate_connection(conn)
+
+        if not self.app_config.token:
+            return
+
+        # Every request carries the token, so the session only needs checking.
+        response = await do_request(
+            conn,
+            "get_user_info",
+            {"username": self.app_config.username},
+            username=self.app_config.username,
+            token=self.app_config.token,
+            raise_on_timeout=True,
+        )
+        if response["code"] == 401:
+            raise SessionExpiredError(response.get("message", ""), response)
+
+    async def reconnect(self) -> LockableClientConnection:
+        delay = self.initial_delay
+        last_exc: Optional[Exception] = None
+
+        for attempt in range(1, self.max_attempts + 1):
+            conn = None
+            try:
+                conn = await get_connection(
+                    self.server_address,
+                    self.disable_ssl_enforcement,
+                    proxy=self.proxy,
+                )
+                await self.restore_session(conn)
+                return conn
+            except SessionExpiredError:
+                assert conn
+                self.app_config.token = None
+                self.page.run_task(
+                    self.leave,
+                    "/login",
+                    _("Your session has expired, please log in again."),
+                )
+                return conn
+            except Exception as exc:
+                last_exc = exc
+                if conn:
+                    await conn._wrapped_connection.close()
+
+            if attempt < self.max_attempts:
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+                delay = min(delay * 2, self.max_delay)
+
+        raise ConnectionError(
+            f"Failed to reconnect to {self.server_address} "
+            f"after {self.max_attempts} attempts"
+        ) from last_exc
+
+    def reconnect_failed(self, exc: BaseException) -> None:
+        self.page.run_task(
+            self.leave,
+            "/connect",
+            _("Lost the connection to the server: {str_err}").format(
+                str_err=str(exc)
+            ),
+        )
+
+    async def leave(self, route: str, message: str) -> None:
+        send_error(self.page, message)
+        await self.page.push_route(route)
@@ -2,47 +2,230 @@ import asyncio
 import base64
 import flet as ft
 import websockets, json, mmap, hashlib, os
+from websockets.exceptions import ConnectionClosed
+from websockets.frames import CloseCode
 import aiofiles.os
+from include.classes.exceptions.request import RequestTimeoutError
 from include.classes.exceptions.transmission import (
+    ChunkHashMismatchError,
     FileHashMismatchError,
     FileSizeMismatchError,
 )
-from include.constants import FLET_APP_STORAGE_TEMP
 from include.classes.client import LockableClientConnection
-from include.util.connect import get_connection
+from include.util.connect import ConnectionPool, get_connection
+from include.util.framing import CHUNK_ENCODINGS, decode_chunk_frame
+from include.util.dedup import recent_uploads
+from include.util.hashcache import file_hash_cache
+from include.util.hashing import ChunkVerifier, StreamHasher
+from include.util.metrics import metrics
+from include.util.requests import get_default_timeout
+from include.util.resume import DOWNLOADING_PATH, DownloadManifest, UploadState
+from include.util.shaping import Priority, bandwidth
+from include.util.workers import crypto_executor
+from include.util.writer import PositionalWriter
 from Crypto.Cipher import AES
-import shutil
-
-
-async def calculate_sha256(file_path):
+import time
+from typing import Any, Literal, Optional
+
+
+# Ciphertext is decrypted from the spool file in segments of this size.
+DECRYPT_BLOCK_SIZE = 1024**2
+
+# In resume mode, the manifest is saved after every this many new chunks.
+MANIFEST_SAVE_INTERVAL = 256
+
+# Segmented downloads fetch this many chunks per ranged request.
+SEGMENT_CHUNKS = 512
+# Seconds between progress updates of a segmented download.
+PROGRESS_INTERVAL = 0.25
+# Seconds between throughput samples that decide whether to add a connection,
+# and the speed-up an added connection must bring to keep adding more.
+ADAPT_INTERVAL = 2.0
+ADAPT_GAIN = 1.1
+# Times a segmented download asks again for a chunk that failed its hash check.
+MAX_CHUNK_REFETCHES = 3
+
+# Uploads start with chunks of this size and adapt it to the connection, down
+# to the minimum and up to the connection's max_size.
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MIN_UPLOAD_CHUNK_SIZE = 8192
+MAX_UPLOAD_CHUNK_SIZE = 4 * 1024**2
+# Sending a chunk should take about this long, or a round trip if that is
+# longer: long enough that per-frame costs do not matter, short enough that
+# progress updates and stopping stay responsive.
+UPLOAD_CHUNK_TIME = 0.05
+# Weight of the newest sample in the smoothed upload throughput.
+THROUGHPUT_SMOOTHING = 0.3
+
+# Per server: the chunk size the next upload starts with, and the largest
+# chunk size the server accepts, learned from refused frames.
+_upload_chunk_sizes: dict[Any, int] = {}
+_upload_chunk_limits: dict[Any, int] = {}
+
+
+def _sha256_file(file_path) -> str:
     # Use faster hashlib tools and memory-mapped files
     with open(file_path, "rb") as f:
         # Use memory-mapped files to map directly to memory
-        mmapped_file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
-        return hashlib.sha256(mmapped_file).hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mmapped_file:
+            return hashlib.sha256(mmapped_file).hexdigest()
+
+
+async def calculate_sha256(file_path, cached: bool = False):
+    """
+    Returns the SHA-256 of the file. With ``cached``, the hash is looked up
+    in and saved to the persistent file hash cache.
+    """
+    if not cached:
+        # Hashing a large file takes a while, keep it off the event loop
+        return await crypto_executor.run(_sha256_file, file_path)
+
+    stat = os.stat(file_path)
+    if (sha256 := await file_hash_cache.lookup(file_path, stat)) is not None:
+        return sha256
+
+    sha256 = await crypto_executor.run(_sha256_file, file_path)
+    await file_hash_cache.store(file_path, stat, sha256)
+    return sha256
+
+
+def _decrypt_segment(key: bytes, iv: bytes, encrypted_segment: bytes) -> bytes:
+    return AES.new(key, AES.MODE_CFB, iv=iv).decrypt(encrypted_segment)
+
+
+async def _recv_transfer_setup(client: LockableClientConnection, action: str):
+    # The setup exchange of a transfer is bounded by the action's deadline.
+    timeout = get_default_timeout(action)
+    try:
+        return await asyncio.wait_for(client.recv(), timeout)
+    except asyncio.TimeoutError:
+        raise RequestTimeoutError(action, timeout) from None
+
+
+class UploadChunkSizer(object):
+    """
+    Adapts the size of upload chunks to the measured send throughput.
+
+    Each chunk should take ``target_time`` to send: the larger of
+    ``UPLOAD_CHUNK_TIME`` and the round trip time. The next chunk size is the
+    smoothed throughput times that, but it at most doubles or halves from one
+    chunk to the next. Sizes are multiples of ``MIN_UPLOAD_CHUNK_SIZE`` within
+    ``[MIN_UPLOAD_CHUNK_SIZE, max_size]``.
+    """
+
+    def __init__(
+        self, max_size: int, rtt: float = 0.0, size: int = UPLOAD_CHUNK_SIZE
+    ) -> None:
+        self.max_size = max(max_size, MIN_UPLOAD_CHUNK_SIZE)
+        self.target_time = max(UPLOAD_CHUNK_TIME, rtt)
+        self.size = self._clamp(size)
+        self.throughput: Optional[float] = None
+
+    def _clamp(self, size: float) -> int:
+        size = int(size) // MIN_UPLOAD_CHUNK_SIZE * MIN_UPLOAD_CHUNK_SIZE
+        return min(max(size, MIN_UPLOAD_CHUNK_SIZE), self.max_size)
+
+    def update(self, sent: int, elapsed: float) -> None:
+        # Short final chunks say little about the connection
+        if sent < self.size or elapsed <= 0:
+            return
+        throughput = sent / elapsed
+        if self.throughput is None:
+            self.throughput = throughput
+        else:
+            self.throughput += THROUGHPUT_SMOOTHING * (throughput - self.throughput)
+
+        wanted = self.throughput * self.target_time
+        self.size = self._clamp(min(max(wanted, self.size / 2), self.size * 2))
+
+    def back_off(self) -> None:
+        self.size = self._clamp(self.size / 2)
 
 
 async def upload_file_to_server(
-    client: LockableClientConnection, task_id: str, file_path: str
+    client: LockableClientConnection,
+    task_id: str,
+    file_path: str,
+    priority: Priority = Priority.FOREGROUND,
+    chunk_size: Optional[int] = None,
+    resume: bool = False,
+    dedup: bool = False,
 ):
+    """
+    Uploads a file to the server, yielding the bytes sent so far and the file
+    size. Chunks are sent at the upload rate limit, with ``priority`` deciding
+    which transfer goes first when several wait for it.
+
+    The chunk size adapts to the connection (see ``UploadChunkSizer``), up to
+    the connection's ``max_size``. The size reached is where the next upload
+    to the same server starts. After a failed upload, that is halved, and a
+    frame refused as too big caps the size for the server. A given
+    ``chunk_size`` is used as is instead.
+
+    In resume mode, which needs a server with the ``resumable_upload``
+    feature, the server reports how many bytes of the task it has committed
+    and the upload continues from there. An ``UploadState`` proves that those
+    bytes came from the same file; it is kept if the upload fails and removed
+    once the upload is done. After the last chunk the server confirms the
+    bytes it has committed, so that a connection lost at the very end is not
+    mistaken for a finished upload.
+
+    In dedup mode, which needs a server with the ``deduplicated_upload``
+    feature, the file's hash and size are announced with ``upload_file``. If
+    the server already holds that content, it completes the task with it and
+    no bytes are sent; a single progress update reports the file as done.
+    Content that is on the server afterwards is added to ``recent_uploads``.
+    """
+
+    stat = os.stat(file_path)
+    file_size = stat.st_size
+
+    request_data: dict = {"task_id": task_id}
+    if resume:
+        request_data["resume"] = True
+
+    sha256 = None
+    if dedup and file_size:
+        # Hash first, as the server may not need the bytes at all
+        sha256 = await calculate_sha256(file_path, cached=True)
+        request_data["sha256"] = sha256
+        request_data["file_size"] = file_size
 
     await client.send(
         json.dumps(
             {
                 "action": "upload_file",
-                "data": {"task_id": task_id},
+                "data": request_data,
             },
             ensure_ascii=False,
         )
     )
 
     # Receive file metadata from the server
-    response = json.loads(await client.recv())
+    response = json.loads(await _recv_transfer_setup(client, "upload_file"))
     if response["action"] != "transfer_file":
         raise ValueError
 
-    file_size = os.path.getsize(file_path)
-    sha256 = await calculate_sha256(file_path) if file_size else None
+    if sha256 is not None and (response.get("data") or {}).get("exists"):
+        recent_uploads.add(sha256, file_size)
+        if resume and (state := UploadState.load(task_id)) is not None:
+            state.discard()
+        yield file_size, file_size
+        return
+
+    if sha256 is None and file_size:
+        sha256 = await calculate_sha256(file_path, cached=True)
+
+    offset = 0
+    state = None
+    if resume:
+        state = UploadState.load(task_id) or UploadState(task_id, file_path)
+        committed: dict = response.get("data") or {}
+        # Continue only if the committed bytes are from this very file
+        if state.matches(stat, sha256) and committed.get("sha256") == sha256:
+            offset = min(committed.get("offset", 0), file_size)
+        state.record_file(stat, sha256)
+        state.save()
 
     task_info = {
         "action": "transfer_file",
@@ -51,179 +234,638 @@ async def upload_file_to_server(
             "file_size": file_size,
         },
     }
+    if resume:
+        task_info["data"]["offset"] = offset
     await client.send(json.dumps(task_info, ensure_ascii=False))
 
-    received_response = await client.recv()
+    # The server answers at once, which gives a round trip time to go by
+    setup_started = time.perf_counter()
+    received_response = await _recv_transfer_setup(client, "upload_file")
+    rtt = time.perf_counter() - setup_started
     if received_response not in ["ready", "stop"]:
         raise RuntimeError
 
+    if received_response == "stop" and state is not None:
+        state.discard()
+
     if received_response == "ready":
 
+        started = time.perf_counter()
+        sent_size = 0
+        failed = True
+
+        server = client.remote_address
+        max_size = min(
+            client.protocol.max_size or MAX_UPLOAD_CHUNK_SIZE,
+            _upload_chunk_limits.get(server, MAX_UPLOAD_CHUNK_SIZE),
+        )
+        sizer = UploadChunkSizer(
+            max_size, rtt, _upload_chunk_sizes.get(server, UPLOAD_CHUNK_SIZE)
+        )
+
         try:
-            chunk_size = 8192
             async with aiofiles.open(file_path, "rb") as f:
+                await f.seek(offset)
                 while True:
-                    chunk = await f.read(chunk_size)
+                    read_size = chunk_size or sizer.size
+                    chunk_started = time.perf_counter()
+                    chunk = await f.read(read_size)
+                    await bandwidth.upload.acquire(len(chunk), priority)
                     await client.send(chunk)
+                    sent_size += len(chunk)
+                    sizer.update(len(chunk), time.perf_counter() - chunk_started)
 
-                    yield await f.tell(), file_size
+                    yield offset + sent_size, file_size
 
-                    if not chunk or len(chunk) < chunk_size:
+                    # A short (or empty) chunk ends the upload
+                    if len(chunk) < read_size:
                         break
-        except:
+
+            if resume:
+                # The server may still be writing out the file, which can take
+                # as long as the upload did. A dead connection is caught by the
+                # keepalive pings instead of a deadline.
+                confirmation = json.loads(await client.recv())
+                if (confirmation.get("data") or {}).get("offset") != file_size:
+                    raise ConnectionError("Server did not commit the whole file")
+            failed = False
+            _upload_chunk_sizes[server] = sizer.size
+            recent_uploads.add(sha256, file_size)
+            if state is not None:
+                state.discard()
+        except ConnectionClosed as exc:
+            if exc.rcvd is not None and exc.rcvd.code == CloseCode.MESSAGE_TOO_BIG:
+                _upload_chunk_limits[server] = max(
+                    sizer.size // 2, MIN_UPLOAD_CHUNK_SIZE
+                )
             raise
+        finally:
+            if failed:
+                sizer.back_off()
+                _upload_chunk_sizes[server] = sizer.size
+            metrics.record_transfer(
+                "upload_file",
+                time.perf_counter() - started,
+                bytes_out=sent_size,
+                failed=failed,
+            )
+
+
+async def _request_download(
+    client: LockableClientConnection,
+    task_id: str,
+    ranges: list[list[int]] | None = None,
+) -> dict:
+    """
+    Sends ``download_file`` and returns the transfer metadata. With ``ranges``
+    the server is asked for only those ``[start, end)`` chunk ranges; servers
+    that honour them echo ``ranges`` back in the metadata.
+    """
+    request_data = {"task_id": task_id, "chunk_encodings": CHUNK_ENCODINGS}
+    if ranges is not None:
+        request_data["ranges"] = ranges
+
+    # Send the request for file metadata
+    await client.send(
+        json.dumps(
+            {
+                "action": "download_file",
+                "data": request_data,
+            },
+            ensure_ascii=False,
+        )
+    )
+
+    # Receive file metadata from the server
+    response = json.loads(await _recv_transfer_setup(client, "download_file"))
+    if response["action"] != "transfer_file":
+        raise ValueError("Invalid action received for file transfer")
+    return response["data"]
+
+
+def _decode_chunk(data: str | bytes):
+    """Returns the index, ciphertext, hash and IV of a download chunk."""
+    if isinstance(data, bytes):
+        # Binary chunk frame, if negotiated
+        return decode_chunk_frame(data)
+
+    chunk_json: dict = json.loads(data)["data"]
+    iv = chunk_json.get("iv")
+    return (
+        chunk_json.get("index"),
+        base64.b64decode(chunk_json.get("chunk")),
+        chunk_json.get("hash"),
+        base64.b64decode(iv) if iv else None,
+    )
+
+
+async def _recv_key(client: LockableClientConnection) -> bytes:
+    # Get decryption information
+    decrypted_data = await client.recv()
+    decrypted_data_json: dict = json.loads(decrypted_data)
+    return base64.b64decode(decrypted_data_json["data"].get("key"))
+
+
+async def decrypt_spool(
+    spool_path: str, file_path: str, key: bytes, iv: bytes, hasher: StreamHasher
+):
+    """
+    Decrypts the spool into ``file_path``, feeding the plaintext to
+    ``hasher``. Yields the number of bytes decrypted so far.
+
+    The output is identical to a single ``AES.new(key, AES.MODE_CFB, iv=iv)``
+    pass. In CFB mode the state before any byte is just the 16 ciphertext
+    bytes that precede it, so a segment of the spool can be decrypted on its
+    own with the end of the previous segment as its IV. Segments of
+    ``DECRYPT_BLOCK_SIZE`` are decrypted in parallel on the crypto worker
+    threads, one batch per worker at a time, and then hashed and written in
+    order. The output file is preallocated to the size of the spool.
+    """
+    decrypted_size = 0
+    segment_iv = iv
+
+    async with aiofiles.open(spool_path, "rb") as spool_file, PositionalWriter(
+        file_path, size=os.path.getsize(spool_path), truncate=True
+    ) as out_file:
+        while True:
+            jobs = []
+            for _ in range(crypto_executor.workers):
+                encrypted_segment = await spool_file.read(DECRYPT_BLOCK_SIZE)
+                if not encrypted_segment:
+                    break
+                jobs.append(
+                    crypto_executor.run(
+                        _decrypt_segment, key, segment_iv, encrypted_segment
+                    )
+                )
+                segment_iv = encrypted_segment[-AES.block_size :]
+            if not jobs:
+                break
+
+            for decrypted_segment in await asyncio.gather(*jobs):
+                await crypto_executor.run(hasher.update, decrypted_segment)
+                await out_file.write(decrypted_size, decrypted_segment)
+                decrypted_size += len(decrypted_segment)
+
+                yield decrypted_size
 
 
 async def receive_file_from_server(
     client: LockableClientConnection,
     task_id: str,
     file_path: str,  # filename: str | None = None
+    resume: bool = False,
+    priority: Priority = Priority.FOREGROUND,
 ):
     """
     Receives a file from the server over a websocket connection using AES encryption.
 
     Steps:
-        1. Requests file metadata (SHA-256 hash, file size, chunk info) from the server.
+        1. Requests file metadata (SHA-256 hash, file size, chunk info) from the server,
+           offering binary chunk frames besides the base64-in-JSON encoding.
         2. Sends readiness acknowledgment to the server.
-        3. Receives encrypted file chunks, saves them temporarily.
-        4. Receives AES key and IV, decrypts all chunks, and writes the output file.
-        5. Deletes temporary chunk files.
-        6. Verifies the file size and SHA-256 hash.
+        3. Receives encrypted file chunks and writes them to a spool file,
+           checking the hash sent with each chunk on the crypto workers.
+        4. Receives the AES key, decrypts the spool in a single pass, and writes
+           the output file.
+        5. Deletes the spool file.
+        6. Verifies the file size and the SHA-256 hash computed while decrypting.
         7. Removes the output file if verification fails.
 
+    In resume mode the received chunk indexes, the IV and the expected hash are
+    recorded in a ``DownloadManifest``, and the spool is kept if the transfer
+    fails. Calling again with the same task then asks the server only for the
+    missing chunk ranges. A server that sends the whole file anyway is handled
+    too, as chunks that are already in the spool are not written again.
+
+    The transfer stops at the first chunk that fails its hash check. Only
+    chunks that passed the check are recorded in the manifest, so the next
+    attempt fetches the corrupt chunks again, along with any whose check
+    could not finish.
+
+    Chunks are read at the download rate limit, with ``priority`` deciding
+    which transfer goes first when several wait for it.
+
     Args:
         client (LockableClientConnection): The websocket client connection.
         task_id (str): The identifier for the file transfer task.
         file_path (str): The path to save the received file.
+        resume (bool): Whether to keep and continue partial downloads.
+        priority (Priority): The priority of the transfer under rate limits.
 
     Yields:
-        Tuple[int, ...]: Progress updates at various stages.
+        Tuple[int, ...]: Progress updates at various stages. The last one,
+        ``(3, sha256)``, carries the hash the file is verified against.
 
     Raises:
         ValueError: If the server response is invalid.
+        ChunkHashMismatchError: If a chunk does not match the hash sent with it.
         FileSizeMismatchError: If the received file size does not match the expected size.
         FileHashMismatchError: If the received file hash does not match the expected hash.
         Exception: For other errors during transfer or decryption.
     """
 
-    # Send the request for file metadata
-    await client.send(
-        json.dumps(
-            {
-                "action": "download_file",
-                "data": {"task_id": task_id},
-            },
-            ensure_ascii=False,
-        )
-    )
+    manifest = DownloadManifest.load(task_id) if resume else None
 
-    # Receive file metadata from the server
-    response = json.loads(await client.recv())
-    if response["action"] != "transfer_file":
-        raise ValueError("Invalid action received for file transfer")
+    metadata = await _request_download(
+        client, task_id, manifest.missing_ranges() if manifest is not None else None
+    )
 
-    sha256 = response["data"].get("sha256")  # SHA256 of original file
-    file_size = response["data"].get("file_size")  # Size of original file
-    chunk_size = response["data"].get("chunk_size", 8192)  # Chunk size
-    total_chunks = response["data"].get("total_chunks")  # Total chunks
+    sha256 = metadata.get("sha256")  # SHA256 of original file
+    file_size = metadata.get("file_size")  # Size of original file
+    chunk_size = metadata.get("chunk_size", 8192)  # Chunk size
+    total_chunks = metadata.get("total_chunks")  # Total chunks
+    # Servers that honour the requested ranges echo them back
+    ranges: list[list[int]] | None = metadata.get("ranges")
+
+    if manifest is not None and not file_size:
+        # Only a task the server has closed in the meantime has no size
+        raise FileSizeMismatchError(manifest.file_size, 0)
+    if manifest is not None and not manifest.matches(
+        sha256, file_size, chunk_size, total_chunks
+    ):
+        manifest.discard()
+        if ranges is not None:
+            raise ValueError("Partial download no longer matches the file on the server")
+        manifest = None
 
     await client.send("ready")
 
-    downloading_path = FLET_APP_STORAGE_TEMP + "/downloading/" + task_id
-    await aiofiles.os.makedirs(downloading_path, exist_ok=True)
+    await aiofiles.os.makedirs(DOWNLOADING_PATH, exist_ok=True)
 
     if not file_size:
         async with aiofiles.open(file_path, "wb") as f:
             await f.truncate(0)
         return
 
-    try:
+    new_spool = manifest is None
+    if manifest is None:
+        manifest = DownloadManifest(
+            task_id, sha256, file_size, chunk_size, total_chunks
+        )
 
-        received_chunks = 0
-        iv: bytes = b""
+    if ranges is not None:
+        expected_chunks = sum(end - start for start, end in ranges)
+    else:
+        expected_chunks = total_chunks
 
-        while received_chunks + 1 <= total_chunks:
-            # Receive encrypted data from the server
+    # All ciphertext is spooled into a single preallocated file, at the
+    # offsets of the chunks.
+    spool_path = manifest.spool_path
 
-            data = await client.recv()
-            if not data:
-                raise ValueError("Received empty data from server")
+    started = time.perf_counter()
+    received_bytes = 0
+    receive_time = None
+    failed = True
+    # Chunk hashes are checked on the crypto workers as chunks arrive, and
+    # only chunks that passed are recorded as received.
+    verifier = ChunkVerifier(manifest.received)
 
-            data_json: dict = json.loads(data)
+    try:
 
-            index = data_json["data"].get("index")
-            if index == 0:
-                iv = base64.b64decode(data_json["data"].get("iv"))
-            chunk_hash = data_json["data"].get("hash")  # provided but unused
-            chunk_data = base64.b64decode(data_json["data"].get("chunk"))
-            chunk_file_path = os.path.join(downloading_path, str(index))
+        received_frames = 0
+        written_chunks = 0
 
-            async with aiofiles.open(chunk_file_path, "wb") as chunk_file:
-                await chunk_file.write(chunk_data)
+        async with PositionalWriter(
+            spool_path, size=file_size, truncate=new_spool
+        ) as spool_file:
+            while received_frames < expected_chunks:
+                # Receive encrypted data from the server
 
-            received_chunks += 1
+                data = await client.recv()
+                if not data:
+                    raise ValueError("Received empty data from server")
 
-            if received_chunks < total_chunks:
-                received_file_size = chunk_size * received_chunks
-            else:
-                received_file_size = file_size
+                received_bytes += len(data)
+                received_frames += 1
+                await bandwidth.download.acquire(len(data), priority)
 
-            yield 0, received_file_size, file_size
+                index, chunk_data, chunk_hash, iv = _decode_chunk(data)
 
-        # Get decryption information
-        decrypted_data = await client.recv()
-        decrypted_data_json: dict = json.loads(decrypted_data)
+                if index == 0:
+                    if manifest.iv and manifest.iv != iv:
+                        # The server encrypted this attempt differently, so the
+                        # chunks kept from before cannot be used.
+                        manifest.received.clear()
+                    manifest.iv = iv or b""
 
-        aes_key = base64.b64decode(decrypted_data_json["data"].get("key"))
+                if index not in manifest.received:
+                    await spool_file.write(index * chunk_size, chunk_data)
+                    await verifier.add(index, chunk_data, chunk_hash)
+                    written_chunks += 1
 
-        # Decrypt chunks
-        decrypted_chunks = 1
-        cipher = AES.new(aes_key, AES.MODE_CFB, iv=iv)  # Initialize cipher
+                    if resume and written_chunks % MANIFEST_SAVE_INTERVAL == 0:
+                        await spool_file.flush()
+                        manifest.save()
 
-        async with aiofiles.open(file_path, "wb") as out_file:
-            while decrypted_chunks <= total_chunks:
-                yield 1, decrypted_chunks, total_chunks
+                # Stop as soon as a chunk turns out to be corrupt, rather
+                # than after the whole file has been received.
+                if corrupt := verifier.corrupt():
+                    raise ChunkHashMismatchError(corrupt)
 
-                chunk_file_path = os.path.join(
-                    downloading_path, str(decrypted_chunks - 1)
-                )
+                yield 0, min(
+                    chunk_size * (len(manifest.received) + verifier.pending),
+                    file_size,
+                ), file_size
+
+        if corrupt := await verifier.drain():
+            raise ChunkHashMismatchError(corrupt)
+
+        if not manifest.complete:
+            raise ValueError("Server did not send all chunks of the file")
 
-                async with aiofiles.open(chunk_file_path, "rb") as chunk_file:
-                    encrypted_chunk = await chunk_file.read()
-                    decrypted_chunk = cipher.decrypt(encrypted_chunk)
-                    await out_file.write(decrypted_chunk)
+        receive_time = time.perf_counter() - started
 
-                # os.remove(chunk_file_path)
-                decrypted_chunks += 1
+        aes_key = await _recv_key(client)
 
-        # Delete temporary folder
+        # Decrypt the spool, in parallel segments
+        hasher = StreamHasher()
+        async for decrypted_size in decrypt_spool(
+            spool_path, file_path, aes_key, manifest.iv, hasher
+        ):
+            yield 1, -(-decrypted_size // chunk_size), total_chunks
+
+        # Delete temporary files
         yield 2,
 
-        await asyncio.get_event_loop().run_in_executor(
-            None, shutil.rmtree, downloading_path
+        manifest.discard()
+        failed = False
+
+    except Exception:
+        # The chunks that did arrive can still be checked, so that the next
+        # attempt does not fetch them again.
+        await verifier.drain()
+        raise
+    finally:
+        verifier.cancel()
+        metrics.record_transfer(
+            "download_file",
+            receive_time if receive_time is not None else time.perf_counter() - started,
+            bytes_in=received_bytes,
+            failed=failed,
         )
+        if failed:
+            if resume and os.path.exists(spool_path):
+                manifest.save()
+            else:
+                manifest.discard()
 
+    # Verify file against the digest computed while decrypting
+
+    yield 3, sha256
+
+    try:
+        hasher.verify(sha256, file_size)
     except:
+        await aiofiles.os.remove(file_path)
         raise
 
-    # Verify file
 
-    async def _action_verify() -> None:
+async def receive_file_segmented(
+    pool: ConnectionPool,
+    server_address: str,
+    task_id: str,
+    file_path: str,
+    max_connections: int = 4,
+    disable_ssl_enforcement: bool = False,
+    max_size: int = 2**20,
+    proxy: str | Literal[True] | None = True,
+    priority: Priority = Priority.FOREGROUND,
+):
+    """
+    Receives a file over several transfer connections at once.
+
+    The download is split into segments of ``SEGMENT_CHUNKS`` chunks, which
+    are fetched as ranged ``download_file`` requests of the same task over
+    connections borrowed from ``pool``. Each segment is written at its offset
+    in a preallocated spool file. The transfer starts with two connections
+    and adds one every ``ADAPT_INTERVAL`` seconds, up to ``max_connections``,
+    for as long as that still raises the throughput.
+
+    The server must honour chunk ranges, which it announces with the
+    ``ranged_download`` feature; ``receive_file_from_server`` remains the way
+    to download from other servers. Progress is kept in a ``DownloadManifest``
+    like in resume mode, so calling again with the same task after a failure
+    continues the download. Chunks that fail their hash check are requested
+    again on their own, up to ``MAX_CHUNK_REFETCHES`` times. All connections
+    share the download rate limit at ``priority``.
+
+    Yields the same progress updates as ``receive_file_from_server``.
+    """
+
+    manifest = DownloadManifest.load(task_id)
+
+    # An empty range list fetches just the metadata and the key.
+    client = await pool.acquire(
+        server_address, disable_ssl_enforcement, max_size, proxy
+    )
+    completed = False
+    try:
+        metadata = await _request_download(client, task_id, [])
+        if metadata.get("ranges") is None:
+            raise ValueError("Server does not support ranged downloads")
+
+        sha256 = metadata.get("sha256")  # SHA256 of original file
+        file_size = metadata.get("file_size")  # Size of original file
+        chunk_size = metadata.get("chunk_size", 8192)  # Chunk size
+        total_chunks = metadata.get("total_chunks")  # Total chunks
+
+        await client.send("ready")
+        if file_size:
+            aes_key = await _recv_key(client)
+        completed = True
+    finally:
+        await pool.release(client, discard=not completed)
+
+    if manifest is not None and not file_size:
+        # Only a task the server has closed in the meantime has no size
+        raise FileSizeMismatchError(manifest.file_size, 0)
+
+    await aiofiles.os.makedirs(DOWNLOADING_PATH, exist_ok=True)
+
+    if not file_size:
+        async with aiofiles.open(file_path, "wb") as f:
+            await f.truncate(0)
+        return
 
-        if file_size != await aiofiles.os.path.getsize(file_path):
-            raise FileSizeMismatchError(
-                file_size, await aiofiles.os.path.getsize(file_path)
+    if manifest is not None and not manifest.matches(
+        sha256, file_size, chunk_size, total_chunks
+    ):
+        manifest.discard()
+        manifest = None
+
+    new_spool = manifest is None
+    if manifest is None:
+        manifest = DownloadManifest(
+            task_id, sha256, file_size, chunk_size, total_chunks
+        )
+
+    # The ciphertext is as long as the file, so the spool is preallocated
+    # and all connections write their chunks into it at their offsets.
+    spool_path = manifest.spool_path
+    spool_file = PositionalWriter(spool_path, size=file_size, truncate=new_spool)
+
+    segments: asyncio.Queue[tuple[int, int]] = asyncio.Queue()
+    for range_start, range_end in manifest.missing_ranges():
+        for segment_start in range(range_start, range_end, SEGMENT_CHUNKS):
+            segments.put_nowait(
+                (segment_start, min(segment_start + SEGMENT_CHUNKS, range_end))
             )
 
-        # Verify SHA256
-        actual_sha256 = await calculate_sha256(file_path)
-        if sha256 and actual_sha256 != sha256:
-            raise FileHashMismatchError(sha256, actual_sha256)
+    started = time.perf_counter()
+    received_bytes = 0
+    written_size = min(chunk_size * len(manifest.received), file_size)
+    receive_time = None
+    failed = True
+
+    refetches: dict[int, int] = {}
+
+    async def receive_segment(client: LockableClientConnection, start: int, end: int):
+        nonlocal received_bytes, written_size
+
+        metadata = await _request_download(client, task_id, [[start, end]])
+        if metadata.get("ranges") is None:
+            raise ValueError("Server does not support ranged downloads")
+        if not manifest.matches(
+            metadata.get("sha256"),
+            metadata.get("file_size"),
+            metadata.get("chunk_size", 8192),
+            metadata.get("total_chunks"),
+        ):
+            raise ValueError("Segment does not belong to the file being downloaded")
+        await client.send("ready")
+
+        corrupt: list[int] = []
+        verifier = ChunkVerifier(manifest.received)
+        try:
+            for _ in range(end - start):
+                data = await client.recv()
+                if not data:
+                    raise ValueError("Received empty data from server")
+                received_bytes += len(data)
+                await bandwidth.download.acquire(len(data), priority)
+
+                index, chunk_data, chunk_hash, iv = _decode_chunk(data)
+                if not start <= index < end:
+                    raise ValueError("Received a chunk outside the requested range")
+                if index == 0:
+                    manifest.iv = iv or b""
+
+                await spool_file.write(index * chunk_size, chunk_data)
+
+                written_size += len(chunk_data)
+                await verifier.add(index, chunk_data, chunk_hash)
+
+            corrupt = await verifier.drain()
+        except Exception:
+            # Check the chunks that did arrive, only they are kept
+            await verifier.drain()
+            raise
+        finally:
+            # Chunks whose check has not finished are fetched again later
+            verifier.cancel()
+            await spool_file.flush()
+            manifest.save()
+
+        await _recv_key(client)
+
+        # Fetch corrupt chunks again, one by one
+        for index in corrupt:
+            refetches[index] = refetches.get(index, 0) + 1
+            if refetches[index] > MAX_CHUNK_REFETCHES:
+                raise ChunkHashMismatchError([index])
+            written_size -= chunk_size
+            segments.put_nowait((index, index + 1))
+
+    async def run_worker():
+        while True:
+            try:
+                start, end = segments.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            client = await pool.acquire(
+                server_address, disable_ssl_enforcement, max_size, proxy
+            )
+            completed = False
+            try:
+                await receive_segment(client, start, end)
+                completed = True
+            finally:
+                await pool.release(client, discard=not completed)
+
+    workers: set[asyncio.Task] = set()
+    try:
+        for _ in range(min(2, max_connections)):
+            workers.add(asyncio.create_task(run_worker()))
+
+        last_adapted = time.perf_counter()
+        last_written = written_size
+        last_throughput = 0.0
+        growing = True
+
+        while workers:
+            done, _ = await asyncio.wait(
+                workers, timeout=PROGRESS_INTERVAL, return_when=asyncio.FIRST_EXCEPTION
+            )
+            for task in done:
+                workers.discard(task)
+                task.result()
+
+            yield 0, min(written_size, file_size), file_size
+
+            now = time.perf_counter()
+            if growing and now - last_adapted >= ADAPT_INTERVAL:
+                throughput = (written_size - last_written) / (now - last_adapted)
+                last_adapted, last_written = now, written_size
+
+                # Keep adding connections while each one still pays off
+                if throughput > last_throughput * ADAPT_GAIN:
+                    last_throughput = throughput
+                    if len(workers) < max_connections and not segments.empty():
+                        workers.add(asyncio.create_task(run_worker()))
+                else:
+                    growing = False
+
+        await spool_file.close()
+        if not manifest.complete:
+            raise ValueError("Server did not send all chunks of the file")
+
+        receive_time = time.perf_counter() - started
+
+        # Decrypt the spool, in parallel segments
+        hasher = StreamHasher()
+        async for decrypted_size in decrypt_spool(
+            spool_path, file_path, aes_key, manifest.iv, hasher
+        ):
+            yield 1, -(-decrypted_size // chunk_size), total_chunks
+
+        # Delete temporary files
+        yield 2,
+
+        manifest.discard()
+        failed = False
+
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await spool_file.close()
+
+        metrics.record_transfer(
+            "download_file",
+            receive_time if receive_time is not None else time.perf_counter() - started,
+            bytes_in=received_bytes,
+            failed=failed,
+        )
+        # The manifest is kept, so that the download can be continued
+
+    # Verify file against the digest computed while decrypting
 
-    yield 3,
+    yield 3, sha256
 
     try:
-        await _action_verify()
+        hasher.verify(sha256, file_size)
     except:
         await aiofiles.os.remove(file_path)
         raise
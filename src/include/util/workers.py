@@ -0,0 +1,77 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+__all__ = [
+    "CryptoExecutor",
+    "DEFAULT_CRYPTO_WORKERS",
+    "crypto_executor",
+]
+
+T = TypeVar("T")
+
+DEFAULT_CRYPTO_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+
+class CryptoExecutor(object):
+    """
+    Runs bulk decryption and hashing on worker threads, so that the event
+    loop stays free to serve the UI and answer websocket pings.
+
+    AES and SHA-256 release the GIL on large buffers, so the threads run in
+    parallel with the loop. At most ``max_pending`` jobs are queued or running
+    at a time; further callers wait, which keeps a fast producer from piling
+    up blocks in memory.
+    """
+
+    def __init__(
+        self, workers: int = DEFAULT_CRYPTO_WORKERS, max_pending: Optional[int] = None
+    ) -> None:
+        self.workers = workers
+        self.max_pending = max_pending or workers * 2
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="crypto"
+            )
+        return self._executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        # A semaphore belongs to one event loop.
+        loop = asyncio.get_running_loop()
+        if loop not in self._slots:
+            self._slots[loop] = asyncio.Semaphore(self.max_pending)
+        return self._slots[loop]
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        async with self._get_slots():
+            return await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), func, *args
+            )
+
+    def resize(self, workers: int) -> None:
+        """
+        Changes the number of worker threads. Jobs that are already running
+        finish on the old threads.
+        """
+        workers = max(1, workers)
+        if workers == self.workers:
+            return
+
+        self.workers = workers
+        self.max_pending = workers * 2
+        self._slots.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+crypto_executor = CryptoExecutor()
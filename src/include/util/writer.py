@@ -0,0 +1,133 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+__all__ = ["PositionalWriter", "preallocate"]
+
+# Buffered chunks are handed to the writer thread once they add up to this
+# many bytes.
+WRITE_COALESCE_SIZE = 1024**2
+
+# All positional writes go through one thread, so that writes to a file never
+# race each other and the event loop never waits on the disk.
+_writer_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+
+
+def preallocate(fd: int, size: int) -> None:
+    """
+    Reserves ``size`` bytes for the file, so that it does not have to grow
+    (and fragment) while chunks are written into it.
+    """
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            # Not supported by every file system
+            pass
+    os.ftruncate(fd, size)
+
+
+def _pwrite(fd: int, data: bytes | memoryview, offset: int) -> None:
+    view = memoryview(data)
+    while view:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(fd, view, offset)
+        else:
+            # Windows has no pwrite; this is safe as only one thread writes
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
+
+def _write_runs(fd: int, chunks: list[tuple[int, bytes | memoryview]]) -> None:
+    # Merge chunks that follow each other into single large writes
+    chunks.sort(key=lambda chunk: chunk[0])
+    run_offset, run = chunks[0][0], [chunks[0][1]]
+    run_end = run_offset + len(chunks[0][1])
+
+    for offset, data in chunks[1:]:
+        if offset != run_end:
+            _pwrite(fd, b"".join(run), run_offset)
+            run_offset, run, run_end = offset, [], offset
+        run.append(data)
+        run_end += len(data)
+
+    _pwrite(fd, b"".join(run), run_offset)
+
+
+class PositionalWriter(object):
+    """
+    Writes data at given offsets of a file, in any order.
+
+    Writes are buffered and handed to a single writer thread once
+    ``WRITE_COALESCE_SIZE`` bytes have been collected, where adjacent pieces
+    are joined into one ``os.pwrite``. A batch is written while the next one
+    is being collected. ``flush`` waits until everything written so far is in
+    the file.
+
+    With ``size`` the file is preallocated to that length, as the writer
+    thread's first job. ``truncate`` discards the existing contents of the
+    file. The writer must be created on the event loop.
+    """
+
+    def __init__(
+        self, path: str, size: Optional[int] = None, truncate: bool = False
+    ) -> None:
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        if truncate:
+            flags |= os.O_TRUNC
+        self.fd = os.open(path, flags, 0o644)
+
+        self._chunks: list[tuple[int, bytes | memoryview]] = []
+        self._buffered = 0
+        self._job: Optional[asyncio.Future] = None
+        if size:
+            # Reserving a large file can take a while on some file systems
+            self._job = asyncio.get_running_loop().run_in_executor(
+                _writer_thread, preallocate, self.fd, size
+            )
+        self.closed = False
+
+    async def _submit(self) -> None:
+        # Wait for the last batch, so that batches do not pile up in memory
+        if self._job is not None:
+            await self._job
+
+        if self._chunks:
+            self._job = asyncio.get_running_loop().run_in_executor(
+                _writer_thread, _write_runs, self.fd, self._chunks
+            )
+            self._chunks, self._buffered = [], 0
+
+    async def write(self, offset: int, data: bytes | memoryview) -> None:
+        self._chunks.append((offset, data))
+        self._buffered += len(data)
+        if self._buffered >= WRITE_COALESCE_SIZE:
+            await self._submit()
+
+    async def flush(self) -> None:
+        await self._submit()
+        # Batches are written in order, so the last one finishes last
+        if self._job is not None:
+            await self._job
+
+    async def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            await self.flush()
+        finally:
+            if self._job is not None:
+                # Let a failed flush's batch finish before closing the file
+                await asyncio.wait([self._job])
+            os.close(self.fd)
+
+    async def __aenter__(self) -> "PositionalWriter":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
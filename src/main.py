@@ -29,6 +29,9 @@ from include.ui.models.settings.language import LanguageSettingsModel
 from include.ui.models.home import HomeModel
 from include.ui.models.manage import ManageModel
 from include.classes.config import AppConfig
+from include.util.cache import document_cache
+from include.util.shaping import bandwidth
+from include.util.workers import DEFAULT_CRYPTO_WORKERS, crypto_executor
 
 # import logging
 # logging.basicConfig(level=logging.DEBUG)
@@ -49,6 +52,22 @@ async def main(page: ft.Page):
                 locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
         except:
             pass  # Ignore locale setting errors
+
+        # Size the decryption and hashing thread pool
+        crypto_executor.resize(
+            app_config.preferences.get("settings", {}).get(
+                "crypto_workers", DEFAULT_CRYPTO_WORKERS
+            )
+        )
+        # Apply the transfer rate limits
+        bandwidth.configure(
+            app_config.preferences.get("settings", {}).get("upload_limit", 0) * 1024,
+            app_config.preferences.get("settings", {}).get("download_limit", 0) * 1024,
+        )
+        document_cache.budget = (
+            app_config.preferences.get("settings", {}).get("document_cache_size", 512)
+            * 1024**2
+        )
     except:
         # If config fails, use default
         os.environ["LANGUAGE"] = "zh_CN"